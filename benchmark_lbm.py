@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+import lattice_boltzman_method_v1
+import lattice_boltzman_method_v2
+
+# Parameters
+GRID_SIZES = [(100, 100), (250, 250), (500, 500), (1000, 1000)]  # Lattices to measure
+STEPS = 20  # Timed steps per measurement
+WARMUP_STEPS = 2  # Untimed steps before measuring
+OUTPUT_PATH = "benchmark_lbm.json"
+
+MODELS = {
+    "v1": lattice_boltzman_method_v1.LatticeBoltzmann,
+    "v2": lattice_boltzman_method_v2.LatticeBoltzmann,
+}
+
+
+def git_revision():
+    """Current commit, so that results from different versions can be told apart."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def distributions(model):
+    return model.f_in if hasattr(model, "f_in") else model.f
+
+
+def benchmark(name, grid_size, steps=STEPS, warmup_steps=WARMUP_STEPS):
+    """Time one model headless: fused update() throughput and the split collision/streaming/particle phases.
+
+    Timing runs with tracemalloc off; peak memory is measured in a separate pass on a fresh model.
+    v2 diverges to inf/NaN within a few steps, so floating-point warnings are silenced and the report
+    records whether the distributions are still finite.
+    """
+    cells = grid_size[0] * grid_size[1]
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        model = MODELS[name](grid_size)
+        for _ in range(warmup_steps):
+            model.update()
+
+        # Throughput of the step the simulation actually uses
+        start = time.perf_counter()
+        for _ in range(steps):
+            model.update()
+        update_time = time.perf_counter() - start
+
+        # Time per phase with the unfused methods
+        phases = {"collision": 0.0, "streaming": 0.0, "particles": 0.0}
+        for _ in range(steps):
+            t0 = time.perf_counter()
+            model.collision()
+            t1 = time.perf_counter()
+            model.streaming()
+            t2 = time.perf_counter()
+            if hasattr(model, "update_particles"):
+                model.update_particles()
+                model.handle_particle_collisions()
+            t3 = time.perf_counter()
+            phases["collision"] += t1 - t0
+            phases["streaming"] += t2 - t1
+            phases["particles"] += t3 - t2
+        finite = bool(np.isfinite(distributions(model)).all())
+
+        # Peak traced memory of building the model and a few steps, untimed
+        tracemalloc.start()
+        model = MODELS[name](grid_size)
+        for _ in range(max(warmup_steps, 1)):
+            model.update()
+        _, peak_traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        "model": name,
+        "grid_size": list(grid_size),
+        "steps": steps,
+        "update_seconds": update_time,
+        "mlups": cells * steps / update_time / 1e6,
+        "phase_seconds_per_step": {phase: total / steps for phase, total in phases.items()},
+        "peak_traced_bytes": peak_traced,
+        "finite": finite,
+    }
+
+
+def main(grid_sizes=GRID_SIZES, steps=STEPS, output_path=OUTPUT_PATH):
+    results = []
+    for grid_size in grid_sizes:
+        for name in MODELS:
+            result = benchmark(name, grid_size, steps)
+            results.append(result)
+            phases = result["phase_seconds_per_step"]
+            print(f"{name} {grid_size[0]}x{grid_size[1]}: {result['mlups']:8.2f} MLUPS  "
+                  f"collision {phases['collision'] * 1e3:7.2f} ms  streaming {phases['streaming'] * 1e3:7.2f} ms  "
+                  f"particles {phases['particles'] * 1e3:7.2f} ms  peak {result['peak_traced_bytes'] / 2 ** 20:7.1f} MiB"
+                  f"{'' if result['finite'] else '  (diverged: inf/NaN values)'}")
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output_path}")
+    return report
+
+
+def parse_grid_size(text):
+    rows, _, cols = text.partition("x")
+    return int(rows), int(cols or rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless throughput benchmark of the lattice Boltzmann models.")
+    parser.add_argument("--sizes", nargs="+", type=parse_grid_size, default=GRID_SIZES,
+                        help="grid sizes as ROWSxCOLS (default: %(default)s)")
+    parser.add_argument("--steps", type=int, default=STEPS, help="timed steps per measurement (default: %(default)s)")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="JSON report path (default: %(default)s)")
+    args = parser.parse_args()
+    main(args.sizes, args.steps, args.output)
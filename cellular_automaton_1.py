@@ -1,3 +1,7 @@
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -53,20 +57,175 @@ def iteracja_absorpcyjna(stan, reguly):
     return nowy_stan
 
 
-def uruchom_automat(numer_albumu, rozmiar, iteracje, warunek_brzegowy):
+# tablica reguły: 8 wartości dla indeksu 4 * lewa + 2 * srodkowa + prawa, liczona raz
+def tablica_reguly(reguly):
+    return np.array([nowy_stan_komorki(i >> 2, (i >> 1) & 1, i & 1, reguly) for i in range(8)], dtype=np.uint8)
+
+# do jednej iteracji całego wiersza naraz (operacje na tablicach zamiast pętli po komórkach)
+def iteracja_wektorowa(stan, tablica, warunek_brzegowy):
+    if warunek_brzegowy == "periodyczny":
+        lewa = np.roll(stan, 1)
+        prawa = np.roll(stan, -1)
+    elif warunek_brzegowy == "absorpcyjny":
+        lewa = np.zeros_like(stan)
+        lewa[1:] = stan[:-1]
+        prawa = np.zeros_like(stan)
+        prawa[:-1] = stan[1:]
+    else:
+        raise ValueError(f"unknown boundary condition: {warunek_brzegowy}")
+    indeks = 4 * lewa + 2 * stan + prawa
+    return tablica[indeks].astype(stan.dtype, copy=False)
+
+
+# reprezentacja spakowana: komórka i to bit (i % 64) słowa (i // 64) w tablicy uint64
+def liczba_slow(rozmiar):
+    return (rozmiar + 63) // 64
+
+# maska bitów należących do komórek w ostatnim słowie (reszta to dopełnienie zerami)
+def maska_ostatniego_slowa(rozmiar):
+    reszta = rozmiar % 64
+    return np.uint64(0xFFFFFFFFFFFFFFFF) if reszta == 0 else np.uint64((1 << reszta) - 1)
+
+def spakuj_stan(stan):
+    bity = np.packbits(np.asarray(stan, dtype=np.uint8), bitorder="little")
+    bajty = np.zeros(liczba_slow(len(stan)) * 8, dtype=np.uint8)
+    bajty[:len(bity)] = bity
+    return bajty.view("<u8").astype(np.uint64, copy=False)
+
+def rozpakuj_stan(slowa, rozmiar):
+    bajty = np.ascontiguousarray(slowa, dtype="<u8").view(np.uint8)
+    return np.unpackbits(bajty, count=rozmiar, bitorder="little")
+
+# do rozpakowania całej historii (np. przed zapisem do CSV lub wizualizacją)
+def rozpakuj_historie(historia, rozmiar):
+    return np.array([rozpakuj_stan(slowa, rozmiar) for slowa in historia])
+
+# do generowania losowego stanu początkowego od razu w postaci spakowanej
+def generuj_stan_spakowany(rozmiar):
+    slowa = np.frombuffer(np.random.bytes(8 * liczba_slow(rozmiar)), dtype="<u8").astype(np.uint64)
+    slowa[-1] &= maska_ostatniego_slowa(rozmiar)
+    return slowa
+
+# do jednej iteracji na słowach: sąsiedzi to przesunięcia bitowe, reguła to suma mintermów tablicy
+def iteracja_spakowana(slowa, rozmiar, tablica, warunek_brzegowy):
+    jeden, szescdziesiat_trzy = np.uint64(1), np.uint64(63)
+    ostatni_bit = np.uint64((rozmiar - 1) % 64)
+
+    if warunek_brzegowy == "periodyczny":
+        lewa_brzeg = (slowa[-1] >> ostatni_bit) & jeden
+        prawa_brzeg = slowa[0] & jeden
+    elif warunek_brzegowy == "absorpcyjny":
+        lewa_brzeg = prawa_brzeg = np.uint64(0)
+    else:
+        raise ValueError(f"unknown boundary condition: {warunek_brzegowy}")
+
+    # bit i w `lewa` to stan komórki i - 1, w `prawa` to stan komórki i + 1
+    lewa = slowa << jeden
+    lewa[1:] |= slowa[:-1] >> szescdziesiat_trzy
+    lewa[0] = (lewa[0] & ~jeden) | lewa_brzeg
+    prawa = slowa >> jeden
+    prawa[:-1] |= slowa[1:] << szescdziesiat_trzy
+    prawa[-1] = (prawa[-1] & ~(jeden << ostatni_bit)) | (prawa_brzeg << ostatni_bit)
+
+    negacje = (~lewa, ~slowa, ~prawa)
+    nowe = np.zeros_like(slowa)
+    for indeks in np.flatnonzero(tablica):
+        nowe |= ((lewa if indeks & 4 else negacje[0])
+                 & (slowa if indeks & 2 else negacje[1])
+                 & (prawa if indeks & 1 else negacje[2]))
+    nowe[-1] &= maska_ostatniego_slowa(rozmiar)
+    return nowe
+
+
+# generator kolejnych generacji (łącznie ze stanem początkowym), bez trzymania historii w pamięci
+def generuj_historie(numer_albumu, rozmiar, iteracje, warunek_brzegowy, spakowany=False):
     reguly = numer_na_reguly(numer_albumu)
-    stan = generuj_stan_poczatkowy(rozmiar)
-    historia = [stan.copy()]
+    tablica = tablica_reguly(reguly)
+
+    if spakowany:
+        stan = generuj_stan_spakowany(rozmiar)
+        krok = lambda s: iteracja_spakowana(s, rozmiar, tablica, warunek_brzegowy)
+    else:
+        stan = generuj_stan_poczatkowy(rozmiar)
+        krok = lambda s: iteracja_wektorowa(s, tablica, warunek_brzegowy)
+    yield stan
 
     for _ in range(iteracje):
-        if warunek_brzegowy == "periodyczny":
-            stan = iteracja_periodyczna(stan, reguly)
-        elif warunek_brzegowy == "absorpcyjny":
-            stan = iteracja_absorpcyjna(stan, reguly)
-        historia.append(stan.copy())
+        stan = krok(stan)
+        yield stan
+
+
+# do zapisu generacji wprost do pliku .npy mapowanego w pamięci, strona po stronie
+def zapisz_historie_npy(generacje, nazwa_pliku, liczba_wierszy, szerokosc, dtype, rozmiar_paczki=1024):
+    plik = np.lib.format.open_memmap(nazwa_pliku, mode="w+", dtype=dtype, shape=(liczba_wierszy, szerokosc))
+    for i, stan in enumerate(generacje):
+        plik[i] = stan
+        # zrzut co paczkę wierszy, żeby brudne strony nie rosły razem z historią
+        if (i + 1) % rozmiar_paczki == 0:
+            plik.flush()
+    plik.flush()
+    del plik
+
+
+# historia z wykrytym cyklem: przechowuje tylko stany do pierwszego powtórzenia,
+# dalsze generacje są wyznaczane leniwie z okresu zamiast ponownego liczenia
+class HistoriaCykliczna:
+    def __init__(self, generacje, dlugosc):
+        self.dlugosc = dlugosc
+        self.stany = []
+        self.przejsciowe = None  # długość fazy przejściowej (indeks pierwszego stanu cyklu)
+        self.okres = None  # długość cyklu, 1 dla punktu stałego
+        widziane = {}
+
+        for i, stan in enumerate(generacje):
+            klucz = hashlib.blake2b(stan.tobytes(), digest_size=16).digest()
+            if klucz in widziane and np.array_equal(self.stany[widziane[klucz]], stan):
+                self.przejsciowe = widziane[klucz]
+                self.okres = i - self.przejsciowe
+                break
+            widziane[klucz] = i
+            self.stany.append(stan.copy())
 
-    return np.array(historia)
+    def __len__(self):
+        return self.dlugosc
 
+    def __getitem__(self, krok):
+        if krok < 0:
+            krok += self.dlugosc
+        if not 0 <= krok < self.dlugosc:
+            raise IndexError("step out of range")
+        if krok < len(self.stany):
+            return self.stany[krok]
+        return self.stany[self.przejsciowe + (krok - self.przejsciowe) % self.okres]
+
+    def __iter__(self):
+        return (self[krok] for krok in range(self.dlugosc))
+
+    def __array__(self, dtype=None, copy=None):
+        return np.array(list(self), dtype=dtype)
+
+
+# spakowany=True: stan trzymany jako bity w słowach uint64, historia ma kształt (iteracje + 1, liczba_slow)
+# plik="...npy": historia zapisywana strumieniowo na dysk i zwracana jako tablica mapowana w pamięci
+# wykrywaj_cykle=True: liczenie kończy się na pierwszym powtórzonym stanie, zwracana jest HistoriaCykliczna
+def uruchom_automat(numer_albumu, rozmiar, iteracje, warunek_brzegowy, spakowany=False, plik=None, rozmiar_paczki=1024,
+                    wykrywaj_cykle=False):
+    generacje = generuj_historie(numer_albumu, rozmiar, iteracje, warunek_brzegowy, spakowany)
+
+    if wykrywaj_cykle:
+        generacje = HistoriaCykliczna(generacje, iteracje + 1)
+        if plik is None:
+            return generacje
+
+    if plik is None:
+        return np.array([stan.copy() for stan in generacje])
+
+    if spakowany:
+        szerokosc, dtype = liczba_slow(rozmiar), np.uint64
+    else:
+        szerokosc, dtype = rozmiar, np.uint8
+    zapisz_historie_npy(generacje, plik, iteracje + 1, szerokosc, dtype, rozmiar_paczki)
+    return np.load(plik, mmap_mode="r")
 
 
 def zapisz_do_csv(historia, nazwa_pliku="wynik.csv"):
@@ -74,6 +233,80 @@ def zapisz_do_csv(historia, nazwa_pliku="wynik.csv"):
     df.to_csv(nazwa_pliku, index=False, header=False)
     print(f"Wynik zapisano do pliku {nazwa_pliku}")
 
+# do zapisu CSV paczkami wierszy (historia może być generatorem lub plikiem .npy mapowanym w pamięci)
+# rozmiar: podany, gdy wiersze są spakowane i trzeba je rozpakować przed zapisem
+def zapisz_do_csv_strumieniowo(historia, nazwa_pliku="wynik.csv", rozmiar=None, rozmiar_paczki=1024):
+    with open(nazwa_pliku, "w") as f:
+        paczka = []
+        for wiersz in historia:
+            paczka.append(wiersz if rozmiar is None else rozpakuj_stan(wiersz, rozmiar))
+            if len(paczka) == rozmiar_paczki:
+                np.savetxt(f, np.array(paczka), fmt="%d", delimiter=",")
+                paczka = []
+        if paczka:
+            np.savetxt(f, np.array(paczka), fmt="%d", delimiter=",")
+    print(f"Wynik zapisano do pliku {nazwa_pliku}")
+
+
+
+
+# PRZEGLĄD REGUŁ:
+# pojedyncza reguła elementarna 0-255 w numeracji Wolframa: sąsiedztwo 4*lewa + 2*środkowa + prawa
+# dostaje bit o tym numerze (inaczej niż nowy_stan_komorki, gdzie to bit 7 - indeks)
+def tablica_reguly_elementarnej(numer_reguly):
+    return np.array([(numer_reguly >> i) & 1 for i in range(8)], dtype=np.uint8)
+
+# do jednej iteracji wielu automatów naraz: wiersz b ma własną tablicę reguły i warunek brzegowy
+def iteracja_wsadowa(stany, tablice, absorpcyjne):
+    lewa = np.roll(stany, 1, axis=1)
+    lewa[absorpcyjne, 0] = 0
+    prawa = np.roll(stany, -1, axis=1)
+    prawa[absorpcyjne, -1] = 0
+    indeks = 4 * lewa + 2 * stany + prawa
+    return np.take_along_axis(tablice, indeks, axis=1)
+
+# skrót stanu końcowego (zamiast przechowywania całej historii)
+def skrot_stanu(stan):
+    return hashlib.blake2b(np.packbits(stan).tobytes(), digest_size=8).hexdigest()
+
+# do przeliczenia jednego wsadu zadań (numer_reguly, ziarno, warunek_brzegowy) jako tablicy 2D
+def przelicz_wsad(zadania, rozmiar, iteracje):
+    for _, _, warunek_brzegowy in zadania:
+        if warunek_brzegowy not in ("periodyczny", "absorpcyjny"):
+            raise ValueError(f"unknown boundary condition: {warunek_brzegowy}")
+    tablice = np.array([tablica_reguly_elementarnej(numer_reguly) for numer_reguly, _, _ in zadania])
+    absorpcyjne = np.array([warunek_brzegowy == "absorpcyjny" for _, _, warunek_brzegowy in zadania])
+    stany = np.array([np.random.default_rng(ziarno).integers(0, 2, size=rozmiar, dtype=np.uint8)
+                      for _, ziarno, _ in zadania])
+
+    gestosc = np.empty((len(zadania), iteracje + 1), dtype=np.float32)
+    gestosc[:, 0] = stany.mean(axis=1)
+    for krok in range(1, iteracje + 1):
+        stany = iteracja_wsadowa(stany, tablice, absorpcyjne)
+        gestosc[:, krok] = stany.mean(axis=1)
+
+    return [
+        {
+            "regula": numer_reguly,
+            "ziarno": ziarno,
+            "warunek_brzegowy": warunek_brzegowy,
+            "gestosc": gestosc[i],
+            "skrot": skrot_stanu(stany[i]),
+        }
+        for i, (numer_reguly, ziarno, warunek_brzegowy) in enumerate(zadania)
+    ]
+
+# do przeglądu wszystkich kombinacji (reguła, ziarno, warunek brzegowy) na puli procesów;
+# zwraca podsumowania przebiegów: gęstość w czasie i skrót stanu końcowego; "regula" to numer Wolframa
+def przeglad_regul(reguly=range(256), ziarna=range(10), warunki_brzegowe=("periodyczny", "absorpcyjny"),
+                   rozmiar=1000, iteracje=500, rozmiar_wsadu=64, procesy=None):
+    zadania = list(itertools.product(reguly, ziarna, warunki_brzegowe))
+    wsady = [zadania[i:i + rozmiar_wsadu] for i in range(0, len(zadania), rozmiar_wsadu)]
+
+    with ProcessPoolExecutor(max_workers=procesy) as pula:
+        wyniki = pula.map(przelicz_wsad, wsady, itertools.repeat(rozmiar), itertools.repeat(iteracje))
+        return [podsumowanie for wsad in wyniki for podsumowanie in wsad]
+
 
 
 
@@ -86,17 +319,18 @@ def wizualizuj_automat(historia, tytul="automat komórkowy 1D"):
     plt.show()
 
 
-numer_albumu = 506045
-rozmiar, iteracje = pobierz_parametry()
+if __name__ == "__main__":
+    numer_albumu = 506045
+    rozmiar, iteracje = pobierz_parametry()
 
 
-# periodyczny warunek
-historia_periodyczna = uruchom_automat(numer_albumu, rozmiar, iteracje, "periodyczny")
-zapisz_do_csv(historia_periodyczna, "wynik_periodyczny.csv")
-wizualizuj_automat(historia_periodyczna, tytul="automat komórkowy 1D - periodyczny")
+    # periodyczny warunek
+    historia_periodyczna = uruchom_automat(numer_albumu, rozmiar, iteracje, "periodyczny")
+    zapisz_do_csv(historia_periodyczna, "wynik_periodyczny.csv")
+    wizualizuj_automat(historia_periodyczna, tytul="automat komórkowy 1D - periodyczny")
 
 
-# absorpcyjny warunek
-historia_absorpcyjna = uruchom_automat(numer_albumu, rozmiar, iteracje, "absorpcyjny")
-zapisz_do_csv(historia_absorpcyjna, "wynik_absorpcyjny.csv")
-wizualizuj_automat(historia_absorpcyjna, tytul="automat komórkowy 1D - absorpcyjny")
+    # absorpcyjny warunek
+    historia_absorpcyjna = uruchom_automat(numer_albumu, rozmiar, iteracje, "absorpcyjny")
+    zapisz_do_csv(historia_absorpcyjna, "wynik_absorpcyjny.csv")
+    wizualizuj_automat(historia_absorpcyjna, tytul="automat komórkowy 1D - absorpcyjny")
@@ -1,85 +1,93 @@
-import numpy as np
-import matplotlib.pyplot as plt
-from PIL import Image
+import io
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
-import matplotlib.pyplot as plt
 from PIL import Image
 
+# domyślne parametry (nadpisywane przez size/steps w animate i run_batch)
+GRID_SIZE = 50
+STEPS = 50
+
+
 # stan początkowy
-def init_grid(pattern="glider"):
-    grid = np.zeros((GRID_SIZE, GRID_SIZE), dtype=int)
+def init_grid(pattern="glider", size=None):
+    size = GRID_SIZE if size is None else size
+    grid = np.zeros((size, size), dtype=np.uint8)
 
     if pattern == "glider":
         # glider
         grid[1, 2] = grid[2, 3] = grid[2, 2] = grid[3, 3] = grid[3, 1] = 1
     elif pattern == "oscillator":
         # oscylator
-        grid[GRID_SIZE//2, GRID_SIZE//2-1:GRID_SIZE//2+2] = 1
+        grid[size//2, size//2-1:size//2+2] = 1
     elif pattern == "random":
         # random
-        grid = np.random.choice([0, 1], (GRID_SIZE, GRID_SIZE), p=[0.8, 0.2])
+        grid = np.random.choice([0, 1], (size, size), p=[0.8, 0.2]).astype(np.uint8)
     elif pattern == "still":
         # neizmienny blok
         grid[1, 2] = grid[2, 3] = grid[2, 1] = grid[3, 3] = grid[3, 1] = grid[4, 2]= 1
     elif pattern == "żabka":
-        grid[GRID_SIZE//2-1, GRID_SIZE//2-1:GRID_SIZE//2+2] = 1
-        grid[GRID_SIZE//2, GRID_SIZE//2-2:GRID_SIZE//2+1] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2-1:GRID_SIZE//2+2] = 1
+        grid[size//2-1, size//2-1:size//2+2] = 1
+        grid[size//2, size//2-2:size//2+1] = 1
+        grid[size//2+1, size//2-1:size//2+2] = 1
     elif pattern == "blinker":
-        grid[GRID_SIZE//2, GRID_SIZE//2-4:GRID_SIZE//2+5] = 1
-        grid[GRID_SIZE//2-1, GRID_SIZE//2-5] = 1
-        grid[GRID_SIZE//2-1, GRID_SIZE//2+4] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2-5] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2+4] = 1
+        grid[size//2, size//2-4:size//2+5] = 1
+        grid[size//2-1, size//2-5] = 1
+        grid[size//2-1, size//2+4] = 1
+        grid[size//2+1, size//2-5] = 1
+        grid[size//2+1, size//2+4] = 1
     elif pattern == "chaos":
-        grid[GRID_SIZE//2, GRID_SIZE//2] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2] = 1
-        grid[GRID_SIZE//2+2, GRID_SIZE//2] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2+1] = 1
-        grid[GRID_SIZE//2+2, GRID_SIZE//2-1] = 1
+        grid[size//2, size//2] = 1
+        grid[size//2+1, size//2] = 1
+        grid[size//2+2, size//2] = 1
+        grid[size//2+1, size//2+1] = 1
+        grid[size//2+2, size//2-1] = 1
     elif pattern == "glider_gun" :
-        grid[GRID_SIZE//2-3, GRID_SIZE//2-4] = 1
-        grid[GRID_SIZE//2-3, GRID_SIZE//2-3] = 1
-        grid[GRID_SIZE//2-2, GRID_SIZE//2-4] = 1
-        grid[GRID_SIZE//2-2, GRID_SIZE//2-3] = 1
-        grid[GRID_SIZE//2-1, GRID_SIZE//2-6] = 1
-        grid[GRID_SIZE//2-1, GRID_SIZE//2-5] = 1
-        grid[GRID_SIZE//2-1, GRID_SIZE//2-4] = 1
-        grid[GRID_SIZE//2-1, GRID_SIZE//2+1] = 1
-        grid[GRID_SIZE//2, GRID_SIZE//2-6] = 1
-        grid[GRID_SIZE//2, GRID_SIZE//2-6] = 1
-        grid[GRID_SIZE//2, GRID_SIZE//2-6] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2-5] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2-5] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2-4] = 1
-        grid[GRID_SIZE//2+1, GRID_SIZE//2+1] = 1
-        grid[GRID_SIZE//2+2, GRID_SIZE//2-5] = 1
-        grid[GRID_SIZE//2+2, GRID_SIZE//2-4] = 1
-        grid[GRID_SIZE//2+2, GRID_SIZE//2-3] = 1
-        grid[GRID_SIZE//2+3, GRID_SIZE//2-4] = 1
+        grid[size//2-3, size//2-4] = 1
+        grid[size//2-3, size//2-3] = 1
+        grid[size//2-2, size//2-4] = 1
+        grid[size//2-2, size//2-3] = 1
+        grid[size//2-1, size//2-6] = 1
+        grid[size//2-1, size//2-5] = 1
+        grid[size//2-1, size//2-4] = 1
+        grid[size//2-1, size//2+1] = 1
+        grid[size//2, size//2-6] = 1
+        grid[size//2, size//2-6] = 1
+        grid[size//2, size//2-6] = 1
+        grid[size//2+1, size//2-5] = 1
+        grid[size//2+1, size//2-5] = 1
+        grid[size//2+1, size//2-4] = 1
+        grid[size//2+1, size//2+1] = 1
+        grid[size//2+2, size//2-5] = 1
+        grid[size//2+2, size//2-4] = 1
+        grid[size//2+2, size//2-3] = 1
+        grid[size//2+3, size//2-4] = 1
     return grid
 
 
 # warunki brzegowe
 def count_neighbors(grid, x, y, boundary="periodic"):
+    size = grid.shape[0]
     if boundary == "periodic":
         return (
-            grid[(x - 1) % GRID_SIZE, (y - 1) % GRID_SIZE]
-            + grid[(x - 1) % GRID_SIZE, y % GRID_SIZE]
-            + grid[(x - 1) % GRID_SIZE, (y + 1) % GRID_SIZE]
-            + grid[x % GRID_SIZE, (y - 1) % GRID_SIZE]
-            + grid[x % GRID_SIZE, (y + 1) % GRID_SIZE]
-            + grid[(x + 1) % GRID_SIZE, (y - 1) % GRID_SIZE]
-            + grid[(x + 1) % GRID_SIZE, y % GRID_SIZE]
-            + grid[(x + 1) % GRID_SIZE, (y + 1) % GRID_SIZE]
+            grid[(x - 1) % size, (y - 1) % size]
+            + grid[(x - 1) % size, y % size]
+            + grid[(x - 1) % size, (y + 1) % size]
+            + grid[x % size, (y - 1) % size]
+            + grid[x % size, (y + 1) % size]
+            + grid[(x + 1) % size, (y - 1) % size]
+            + grid[(x + 1) % size, y % size]
+            + grid[(x + 1) % size, (y + 1) % size]
         )
     elif boundary == "reflective":
         def get(i, j):
             if i < 0: i = 0
-            if i >= GRID_SIZE: i = GRID_SIZE - 1
+            if i >= size: i = size - 1
             if j < 0: j = 0
-            if j >= GRID_SIZE: j = GRID_SIZE - 1
+            if j >= size: j = size - 1
             return grid[i, j]
         return (
             get(x - 1, y - 1)
@@ -93,70 +101,505 @@ def count_neighbors(grid, x, y, boundary="periodic"):
         )
 
 
+# obramowanie siatki jedną komórką zgodnie z warunkiem brzegowym
+# (periodic -> zawinięcie, reflective -> powielenie komórki brzegowej, jak w count_neighbors)
+def pad_grid(grid, boundary="periodic"):
+    if boundary == "periodic":
+        return np.pad(grid, 1, mode="wrap")
+    elif boundary == "reflective":
+        return np.pad(grid, 1, mode="edge")
+    raise ValueError(f"unknown boundary: {boundary}")
+
+
+# liczba żywych sąsiadów dla całej siatki naraz (suma 8 przesuniętych widoków)
+def count_neighbors_grid(grid, boundary="periodic"):
+    grid = np.asarray(grid, dtype=np.uint8)
+    padded = pad_grid(grid, boundary)
+    rows, cols = grid.shape
+    neighbors = np.zeros(grid.shape, dtype=np.uint8)
+    for dx in (0, 1, 2):
+        for dy in (0, 1, 2):
+            if dx != 1 or dy != 1:
+                neighbors += padded[dx:dx + rows, dy:dy + cols]
+    return neighbors
+
+
 # reguły
 def apply_rules(grid, boundary="periodic"):
-    new_grid = np.zeros((GRID_SIZE, GRID_SIZE), dtype=int)
-    for x in range(GRID_SIZE):
-        for y in range(GRID_SIZE):
-            neighbors = count_neighbors(grid, x, y, boundary)
-            if grid[x, y] == 1:
-                if neighbors < 2 or neighbors > 3:
-                    new_grid[x, y] = 0  # dead
-                else:
-                    new_grid[x, y] = 1  # alive
+    neighbors = count_neighbors_grid(grid, boundary)
+    # born: dokładnie 3 sąsiadów, alive: żywa z 2 sąsiadami
+    return ((neighbors == 3) | ((grid == 1) & (neighbors == 2))).astype(np.uint8)
+
+
+
+# HASHLIFE:
+# węzeł drzewa czwórkowego: poziom k obejmuje kwadrat 2^k x 2^k komórek (nw, ne, sw, se to ćwiartki)
+class Node:
+    __slots__ = ("k", "nw", "ne", "sw", "se", "n", "next")
+
+    def __init__(self, k, nw=None, ne=None, sw=None, se=None, n=0):
+        self.k = k
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se
+        self.n = n  # liczba żywych komórek
+        self.next = {}  # pamięć wyników: j -> centrum węzła po 2^j generacjach
+
+
+OFF = Node(0, n=0)
+ON = Node(0, n=1)
+
+
+# silnik HashLife na nieograniczonej płaszczyźnie (bez warunków brzegowych);
+# komórka (x, y) siatki wejściowej zachowuje swoje współrzędne w to_array
+class HashLife:
+    def __init__(self, grid, max_nodes=1_000_000):
+        self.max_nodes = max_nodes
+        self.cache = OrderedDict()  # (nw, ne, sw, se) -> węzeł, usuwane najdawniej używane
+        self.zeros = [OFF]
+        self.generation = 0
+
+        size = max(grid.shape + (4,))
+        k = (size - 1).bit_length()
+        # środek płaszczyzny w (offset, offset) współrzędnych siatki
+        self.offset = 2 ** (k - 1)
+        self.root = self.build(np.asarray(grid), 0, 0, k)
+
+    @property
+    def population(self):
+        return self.root.n
+
+    def join(self, nw, ne, sw, se):
+        key = (nw, ne, sw, se)
+        node = self.cache.get(key)
+        if node is not None:
+            self.cache.move_to_end(key)
+            return node
+        node = Node(nw.k + 1, nw, ne, sw, se, nw.n + ne.n + sw.n + se.n)
+        self.cache[key] = node
+        if len(self.cache) > self.max_nodes:
+            # węzły nadal obecne w drzewie pozostają poprawne, tracą tylko kanoniczność
+            self.cache.popitem(last=False)
+        return node
+
+    def zero(self, k):
+        while len(self.zeros) <= k:
+            z = self.zeros[-1]
+            self.zeros.append(self.join(z, z, z, z))
+        return self.zeros[k]
+
+    def build(self, grid, x, y, k):
+        if x >= grid.shape[0] or y >= grid.shape[1]:
+            return self.zero(k)
+        if k == 0:
+            return ON if grid[x, y] else OFF
+        half = 2 ** (k - 1)
+        if not grid[x:x + 2 * half, y:y + 2 * half].any():
+            return self.zero(k)
+        return self.join(self.build(grid, x, y, k - 1), self.build(grid, x, y + half, k - 1),
+                         self.build(grid, x + half, y, k - 1), self.build(grid, x + half, y + half, k - 1))
+
+    # ten sam obszar w środku węzła o poziom wyżej
+    def centre(self, m):
+        z = self.zero(m.k - 1)
+        return self.join(self.join(z, z, z, m.nw), self.join(z, z, m.ne, z),
+                         self.join(z, m.sw, z, z), self.join(m.se, z, z, z))
+
+    # czy żywe komórki leżą tylko w środkowej połowie węzła
+    def is_padded(self, m):
+        inner = m.nw.se.n + m.ne.sw.n + m.sw.ne.n + m.se.nw.n
+        return m.k >= 3 and inner == m.n
+
+    # jedna generacja dla centralnych 2x2 komórek węzła 4x4
+    def life_4x4(self, m):
+        cells = [[m.nw.nw, m.nw.ne, m.ne.nw, m.ne.ne],
+                 [m.nw.sw, m.nw.se, m.ne.sw, m.ne.se],
+                 [m.sw.nw, m.sw.ne, m.se.nw, m.se.ne],
+                 [m.sw.sw, m.sw.se, m.se.sw, m.se.se]]
+        result = []
+        for x in (1, 2):
+            for y in (1, 2):
+                neighbors = sum(cells[i][j].n for i in (x - 1, x, x + 1) for j in (y - 1, y, y + 1)) - cells[x][y].n
+                alive = neighbors == 3 or (cells[x][y].n and neighbors == 2)
+                result.append(ON if alive else OFF)
+        return self.join(*result)
+
+    # centrum węzła poziomu k po 2^j generacjach (j <= k - 2)
+    def successor(self, m, j):
+        j = min(j, m.k - 2)
+        if m.n == 0:
+            return m.nw
+        if j in m.next:
+            return m.next[j]
+        if m.k == 2:
+            s = self.life_4x4(m)
+        else:
+            join, step = self.join, lambda n: self.successor(n, j)
+            c1 = step(m.nw)
+            c2 = step(join(m.nw.ne, m.ne.nw, m.nw.se, m.ne.sw))
+            c3 = step(m.ne)
+            c4 = step(join(m.nw.sw, m.nw.se, m.sw.nw, m.sw.ne))
+            c5 = step(join(m.nw.se, m.ne.sw, m.sw.ne, m.se.nw))
+            c6 = step(join(m.ne.sw, m.ne.se, m.se.nw, m.se.ne))
+            c7 = step(m.sw)
+            c8 = step(join(m.sw.ne, m.se.nw, m.sw.se, m.se.sw))
+            c9 = step(m.se)
+            if j < m.k - 2:
+                s = join(join(c1.se, c2.sw, c4.ne, c5.nw), join(c2.se, c3.sw, c5.ne, c6.nw),
+                         join(c4.se, c5.sw, c7.ne, c8.nw), join(c5.se, c6.sw, c8.ne, c9.nw))
             else:
-                if neighbors == 3:
-                    new_grid[x, y] = 1  # born
-    return new_grid
+                s = join(step(join(c1, c2, c4, c5)), step(join(c2, c3, c5, c6)),
+                         step(join(c4, c5, c7, c8)), step(join(c5, c6, c8, c9)))
+        m.next[j] = s
+        return s
 
+    # przesunięcie o dowolną liczbę generacji, skokami po 2^j
+    def advance(self, generations):
+        node = self.root
+        j = 0
+        while generations >> j:
+            if generations >> j & 1:
+                while node.k < j + 3 or not self.is_padded(node):
+                    node = self.centre(node)
+                node = self.successor(self.centre(node), j)
+            j += 1
+        self.root = node
+        self.generation += generations
+        return self
 
+    # gęsta tablica uint8 dla okna [x, x + rows) x [y, y + cols) we współrzędnych siatki wejściowej
+    def to_array(self, x=0, y=0, rows=None, cols=None):
+        rows = GRID_SIZE if rows is None else rows
+        cols = rows if cols is None else cols
+        grid = np.zeros((rows, cols), dtype=np.uint8)
+        half = 2 ** (self.root.k - 1)
+        self.fill(grid, self.root, self.offset - half - x, self.offset - half - y)
+        return grid
 
-# tworzenie gifa
-def animate(pattern="glider", boundary="periodic"):
-    grid = init_grid(pattern)
-    images = []
+    # (x, y) to pozycja lewego górnego rogu węzła względem okna
+    def fill(self, grid, m, x, y):
+        size = 2 ** m.k
+        if m.n == 0 or x >= grid.shape[0] or y >= grid.shape[1] or x + size <= 0 or y + size <= 0:
+            return
+        if m.k == 0:
+            grid[x, y] = 1
+            return
+        half = size // 2
+        self.fill(grid, m.nw, x, y)
+        self.fill(grid, m.ne, x, y + half)
+        self.fill(grid, m.sw, x + half, y)
+        self.fill(grid, m.se, x + half, y + half)
+
+
+
+# AKTYWNE KAFELKI:
+# silnik liczący tylko kafelki tile x tile, w których lub obok których coś zmieniło się w poprzednim kroku
+class SparseLife:
+    def __init__(self, grid, boundary="periodic", tile=32):
+        self.boundary = boundary
+        self.tile = tile
+        self.padded = pad_grid(np.asarray(grid, dtype=np.uint8), boundary)
+        rows, cols = grid.shape
+        self.tiles = (-(-rows // tile), -(-cols // tile))
+
+        # na start aktywne są kafelki z żywymi komórkami i ich sąsiedzi
+        alive = np.zeros(self.tiles, dtype=bool)
+        xs, ys = np.nonzero(grid)
+        alive[xs // tile, ys // tile] = True
+        self.active = self.dilate(alive)
+
+    @property
+    def grid(self):
+        return self.padded[1:-1, 1:-1]
+
+    # kafelki sąsiadujące z zaznaczonymi (periodic -> zawinięcie indeksów, reflective -> obcięcie)
+    def dilate(self, mask):
+        result = mask.copy()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if self.boundary == "periodic":
+                    result |= np.roll(mask, (dx, dy), axis=(0, 1))
+                else:
+                    shifted = np.zeros_like(mask)
+                    shifted[max(dx, 0):mask.shape[0] + min(dx, 0), max(dy, 0):mask.shape[1] + min(dy, 0)] = \
+                        mask[max(-dx, 0):mask.shape[0] + min(-dx, 0), max(-dy, 0):mask.shape[1] + min(-dy, 0)]
+                    result |= shifted
+        return result
+
+    # odświeżenie obramowania po zmianie wnętrza (koszt proporcjonalny do obwodu, nie pola)
+    def refresh_halo(self):
+        p = self.padded
+        if self.boundary == "periodic":
+            p[0, 1:-1], p[-1, 1:-1] = p[-2, 1:-1], p[1, 1:-1]
+            p[:, 0], p[:, -1] = p[:, -2], p[:, 1]
+        else:
+            p[0, 1:-1], p[-1, 1:-1] = p[1, 1:-1], p[-2, 1:-1]
+            p[:, 0], p[:, -1] = p[:, 1], p[:, -2]
 
-    for step in range(STEPS):
-        fig, ax = plt.subplots(figsize=(6, 6))
-        ax.imshow(grid, cmap="binary")
-        plt.axis('off')
+    def step(self):
+        rows, cols = self.grid.shape
+        updates = []
+        changed = np.zeros(self.tiles, dtype=bool)
+        for ti, tj in np.argwhere(self.active):
+            x0, y0 = ti * self.tile, tj * self.tile
+            x1, y1 = min(x0 + self.tile, rows), min(y0 + self.tile, cols)
+            window = self.padded[x0:x1 + 2, y0:y1 + 2]
+            neighbors = np.zeros((x1 - x0, y1 - y0), dtype=np.uint8)
+            for dx in (0, 1, 2):
+                for dy in (0, 1, 2):
+                    if dx != 1 or dy != 1:
+                        neighbors += window[dx:dx + x1 - x0, dy:dy + y1 - y0]
+            old = window[1:-1, 1:-1]
+            new = ((neighbors == 3) | ((old == 1) & (neighbors == 2))).astype(np.uint8)
+            if not np.array_equal(new, old):
+                changed[ti, tj] = True
+                updates.append((x0, y0, new))
 
-        # tymczasową klatkę jako obraz PNG
-        filename = f"frame_{step}.png"
-        plt.savefig(filename)
-        plt.close(fig)
+        # zapis dopiero po policzeniu wszystkich kafelków, bo czytają one stan sąsiadów
+        for x0, y0, new in updates:
+            self.padded[x0 + 1:x0 + 1 + new.shape[0], y0 + 1:y0 + 1 + new.shape[1]] = new
+        if updates:
+            self.refresh_halo()
+        self.active = self.dilate(changed)
+        return self.grid
 
-        # obraz jako klatkę do GIF-a
-        images.append(Image.open(filename))
 
-        # aktualizuj stan gry
-        grid = apply_rules(grid, boundary)
 
-    # gif:
-    images[0].save(f"game_of_life_{pattern}_{boundary}.gif", save_all=True, append_images=images[1:], duration=200, loop=0)
+# BITBOARD:
+# wiersz siatki jako słowa uint64: komórka (x, y) to bit (y % 64) słowa [x, y // 64]
+def pack_grid(grid):
+    rows, cols = grid.shape
+    words = -(-cols // 64)
+    packed = np.zeros((rows, words * 8), dtype=np.uint8)
+    packed[:, :-(-cols // 8)] = np.packbits(np.asarray(grid, dtype=np.uint8), axis=1, bitorder="little")
+    return packed.view("<u8").astype(np.uint64, copy=False)
+
+
+def unpack_grid(words, cols):
+    packed = np.ascontiguousarray(words, dtype="<u8").view(np.uint8)
+    return np.unpackbits(packed, axis=1, count=cols, bitorder="little")
+
+
+# sąsiedzi w poziomie: bit y wyniku to komórka y - 1 (west) lub y + 1 (east)
+def shift_west_east(words, cols, boundary):
+    one, top = np.uint64(1), np.uint64(63)
+    last = np.uint64((cols - 1) % 64)
+    first_cell = words[:, 0] & one
+    last_cell = (words[:, -1] >> last) & one
+    if boundary == "periodic":
+        west_fill, east_fill = last_cell, first_cell
+    else:
+        west_fill, east_fill = first_cell, last_cell
+
+    west = words << one
+    west[:, 1:] |= words[:, :-1] >> top
+    west[:, 0] = (west[:, 0] & ~one) | west_fill
+    east = words >> one
+    east[:, :-1] |= words[:, 1:] << top
+    east[:, -1] = (east[:, -1] & ~(one << last)) | (east_fill << last)
+    return west, east
+
+
+# sąsiedzi w pionie: wiersz x - 1 (north) lub x + 1 (south)
+def shift_north_south(words, boundary):
+    if boundary == "periodic":
+        return np.roll(words, 1, axis=0), np.roll(words, -1, axis=0)
+    north = np.concatenate((words[:1], words[:-1]))
+    south = np.concatenate((words[1:], words[-1:]))
+    return north, south
+
+
+def full_adder(a, b, c):
+    return a ^ b ^ c, (a & b) | (c & (a ^ b))
+
+
+# jedna generacja B3/S23: liczba sąsiadów z sumatorów bitowych, wszystkie 64 komórki słowa naraz
+def bitboard_step(words, cols, boundary="periodic"):
+    if boundary not in ("periodic", "reflective"):
+        raise ValueError(f"unknown boundary: {boundary}")
+    north, south = shift_north_south(words, boundary)
+    nw, ne = shift_west_east(north, cols, boundary)
+    w, e = shift_west_east(words, cols, boundary)
+    sw, se = shift_west_east(south, cols, boundary)
+
+    s_a, c_a = full_adder(nw, north, ne)
+    s_b, c_b = full_adder(w, e, sw)
+    s_c, c_c = south ^ se, south & se
+    ones, c_d = full_adder(s_a, s_b, s_c)
+    t, c_e = full_adder(c_a, c_b, c_c)
+    twos, c_f = t ^ c_d, t & c_d
+    at_least_four = c_e | c_f
+
+    # born: 3 sąsiadów (ones i twos), alive: 2 sąsiadów (twos) i żywa komórka
+    new = twos & ~at_least_four & (ones | words)
+    rest = cols % 64
+    if rest:
+        new[:, -1] &= np.uint64((1 << rest) - 1)
+    return new
+
+
+
+# ZAPIS GIF-A:
+# paleta klatki: indeks 0 -> martwa (biała), 1 -> żywa (czarna), jak cmap="binary"
+PALETTE = [255, 255, 255, 0, 0, 0]
+
+
+# stan gry jako klatka z indeksami palety, powiększona przez powielenie komórek
+def render_frame(grid, scale=1):
+    frame = np.ascontiguousarray(np.repeat(np.repeat(grid.astype(np.uint8), scale, axis=0), scale, axis=1))
+    image = Image.frombytes("P", (frame.shape[1], frame.shape[0]), frame.tobytes())
+    image.putpalette(PALETTE)
+    return image
+
+
+# strumieniowy zapis animowanego GIF-a: każda klatka trafia do pliku od razu po zakodowaniu,
+# kompresję LZW wykonuje PIL dla pojedynczej klatki
+class GifWriter:
+    def __init__(self, path, size, duration=200, loop=0):
+        self.file = open(path, "wb")
+        self.duration = duration
+        width, height = size
+        # nagłówek bez globalnej palety (każda klatka ma własną), rozszerzenie NETSCAPE z liczbą powtórzeń
+        self.file.write(b"GIF89a" + width.to_bytes(2, "little") + height.to_bytes(2, "little") + b"\x70\x00\x00")
+        self.file.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + loop.to_bytes(2, "little") + b"\x00")
+
+    def append(self, image):
+        buffer = io.BytesIO()
+        image.save(buffer, format="GIF")
+        data = buffer.getvalue()
+
+        # pominięcie nagłówka i zapamiętanie globalnej palety pojedynczej klatki
+        flags = data[10]
+        pos = 13
+        palette, palette_bits = b"", 0
+        if flags & 0x80:
+            palette_bits = flags & 0x07
+            palette = data[pos:pos + 3 * 2 ** (palette_bits + 1)]
+            pos += len(palette)
+
+        # pominięcie rozszerzeń aż do deskryptora obrazu
+        while data[pos] == 0x21:
+            pos += 2
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        descriptor = bytearray(data[pos:pos + 10])
+        pos += 10
+        if not descriptor[9] & 0x80:
+            # globalna paleta klatki staje się jej paletą lokalną
+            descriptor[9] = (descriptor[9] & 0x78) | 0x80 | palette_bits
+            descriptor += palette
+
+        # dane LZW: bajt rozmiaru kodu i podbloki zakończone zerem
+        start = pos
+        pos += 1
+        while data[pos]:
+            pos += data[pos] + 1
+        pos += 1
+
+        delay = (self.duration // 10).to_bytes(2, "little")
+        self.file.write(b"\x21\xf9\x04\x04" + delay + b"\x00\x00")
+        self.file.write(bytes(descriptor) + data[start:pos])
+
+    def close(self):
+        self.file.write(b"\x3b")
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+
+# tworzenie gifa
+# engine="hashlife": plansza nieograniczona (boundary pomijany), klatka to okno size x size
+# engine="sparse": liczone tylko aktywne kafelki
+# engine="bitboard": wiersze spakowane w słowa uint64
+# scale: liczba pikseli na komórkę (domyślnie ok. 600 px na bok)
+def animate(pattern="glider", boundary="periodic", engine="dense", scale=None, size=None, steps=None,
+            output_path=None):
+    steps = STEPS if steps is None else steps
+    if output_path is None:
+        output_path = f"game_of_life_{pattern}_{boundary}.gif"
+    grid = init_grid(pattern, size)
+    if engine == "hashlife":
+        life = HashLife(grid)
+    elif engine == "sparse":
+        life = SparseLife(grid, boundary)
+    elif engine == "bitboard":
+        words = pack_grid(grid)
+    elif engine != "dense":
+        raise ValueError(f"unknown engine: {engine}")
+    if scale is None:
+        scale = max(1, 600 // max(grid.shape))
+
+    frame_size = (grid.shape[1] * scale, grid.shape[0] * scale)
+    with GifWriter(output_path, frame_size, duration=200, loop=0) as gif:
+        for step in range(steps):
+            # klatka prosto ze stanu gry, bez pliku tymczasowego
+            gif.append(render_frame(grid, scale))
+
+            # aktualizuj stan gry
+            if engine == "hashlife":
+                grid = life.advance(1).to_array(0, 0, *grid.shape)
+            elif engine == "sparse":
+                grid = life.step().copy()
+            elif engine == "bitboard":
+                words = bitboard_step(words, grid.shape[1], boundary)
+                grid = unpack_grid(words, grid.shape[1])
+            else:
+                grid = apply_rules(grid, boundary)
 
 
+# URUCHOMIENIA WSADOWE:
+# jedno zadanie (pattern, boundary, size, steps) z własnym ziarnem i plikiem wyjściowym
+def run_job(pattern, boundary, size, steps, seed, output_path, engine="dense"):
+    np.random.seed(seed)
+    start = time.perf_counter()
+    animate(pattern, boundary, engine=engine, size=size, steps=steps, output_path=output_path)
+    wall_time = time.perf_counter() - start
+    return {
+        "pattern": pattern,
+        "boundary": boundary,
+        "size": size,
+        "steps": steps,
+        "seed": seed,
+        "output_path": output_path,
+        "wall_time": wall_time,
+        "generations_per_second": steps / wall_time,
+    }
 
-animate(pattern="glider", boundary="periodic")
-animate(pattern="glider", boundary="reflective")
 
-animate(pattern="oscillator", boundary="periodic")
-#animate(pattern="oscillator", boundary="reflective")
+# zadania rozdzielane na pulę procesów; zadanie i dostaje ziarno seed + i i własny plik z tym ziarnem w nazwie
+def run_batch(jobs, output_dir=".", engine="dense", seed=0, processes=None):
+    os.makedirs(output_dir, exist_ok=True)
+    args = []
+    for i, (pattern, boundary, size, steps) in enumerate(jobs):
+        output_path = os.path.join(output_dir, f"game_of_life_{pattern}_{boundary}_{size}_{seed + i}.gif")
+        args.append((pattern, boundary, size, steps, seed + i, output_path, engine))
 
-animate(pattern="random", boundary="periodic")
-#animate(pattern="random", boundary="reflective")
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(run_job, *job) for job in args]
+        return [future.result() for future in futures]
 
-animate(pattern="still", boundary="periodic")
-#animate(pattern="still", boundary="reflective")
 
-animate(pattern="żabka", boundary="periodic")
-#animate(pattern="żabka", boundary="reflective")
+def print_report(results):
+    for r in results:
+        print(f"{r['pattern']:>12} {r['boundary']:>10} {r['size']:>5} {r['steps']:>5}  "
+              f"{r['wall_time']:8.3f} s  {r['generations_per_second']:10.1f} gen/s  -> {r['output_path']}")
 
-animate(pattern="blinker", boundary="periodic")
-#animate(pattern="blinker", boundary="reflective")
 
-animate(pattern="chaos", boundary="periodic")
-#animate(pattern="chaos", boundary="reflective")
 
-animate(pattern="glider_gun", boundary="periodic")
-#animate(pattern=""glider_gun", boundary="reflective")
+if __name__ == "__main__":
+    jobs = [
+        ("glider", "periodic", GRID_SIZE, STEPS),
+        ("glider", "reflective", GRID_SIZE, STEPS),
+        ("oscillator", "periodic", GRID_SIZE, STEPS),
+        ("random", "periodic", GRID_SIZE, STEPS),
+        ("still", "periodic", GRID_SIZE, STEPS),
+        ("żabka", "periodic", GRID_SIZE, STEPS),
+        ("blinker", "periodic", GRID_SIZE, STEPS),
+        ("chaos", "periodic", GRID_SIZE, STEPS),
+        ("glider_gun", "periodic", GRID_SIZE, STEPS),
+    ]
+    print_report(run_batch(jobs))
@@ -0,0 +1,68 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+# Checkpoints are directories holding one .npy file per array plus params.json.
+# Arrays are opened memory-mapped, so restoring or inspecting does not read them into RAM.
+# A new checkpoint is written to path.tmp and swapped in with two renames (path -> path.old, path.tmp -> path);
+# a crash between them leaves only path.old, which checkpoint_exists/load_checkpoint fall back to.
+
+def save_checkpoint(path, arrays, params):
+    """Write arrays and JSON-serialisable params to the directory `path`, replacing any previous checkpoint."""
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, array in arrays.items():
+        out = np.lib.format.open_memmap(os.path.join(tmp_path, name + ".npy"), mode="w+",
+                                        dtype=array.dtype, shape=array.shape)
+        out[...] = array
+        out.flush()
+        del out
+    with open(os.path.join(tmp_path, "params.json"), "w") as f:
+        json.dump(params, f, indent=2)
+
+    old_path = path + ".old"
+    if os.path.exists(path):
+        shutil.rmtree(old_path, ignore_errors=True)
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def checkpoint_directory(path):
+    """The directory holding the latest complete checkpoint for `path`, or None if there is none."""
+    for directory in (path, path + ".old"):
+        if os.path.exists(os.path.join(directory, "params.json")):
+            return directory
+    return None
+
+
+def checkpoint_exists(path):
+    return checkpoint_directory(path) is not None
+
+
+def load_checkpoint(path, mmap_mode="c"):
+    """Return (arrays, params); arrays are memmaps (copy-on-write by default, so the file stays intact)."""
+    directory = checkpoint_directory(path)
+    if directory is None:
+        raise FileNotFoundError(f"no checkpoint at {path}")
+    path = directory
+    with open(os.path.join(path, "params.json")) as f:
+        params = json.load(f)
+    arrays = {}
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith(".npy"):
+            arrays[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+    return arrays, params
+
+
+def inspect_checkpoint(path):
+    """Params plus shape and dtype of every stored array, read from the file headers only."""
+    arrays, params = load_checkpoint(path, mmap_mode="r")
+    return {
+        "params": params,
+        "arrays": {name: {"shape": list(a.shape), "dtype": str(a.dtype)} for name, a in arrays.items()},
+    }
@@ -1,84 +1,264 @@
+import csv
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import matplotlib.pyplot as plt
 from PIL import Image
 from IPython.display import clear_output
 import imageio
-import random
 
 
 EMPTY, TREE, FIRE, BURNT, WATER, ROCK, CONTAMINATED_WATER, BURNING_FOREST = 0, 1, 2, 3, 4, 5, 6, 7
 
 
+# kolory mapy -> stany automatu; pozostałe kolory to EMPTY
+TERRAIN_COLORS = {
+    (34, 139, 34): TREE,   # zielony
+    (0, 0, 255): WATER,    # niebieski
+    (139, 69, 19): ROCK,   # brązowy na mapie -> szary w symulacji
+}
+
+
 # wczytanie mapy
 def load_map(image_path):
+    """Mapa jako tablica (H, W, 3). Pliki .npy są mapowane z dysku, więc duże rastry nie trafiają w całości do pamięci."""
+    if image_path.endswith('.npy'):
+        return np.load(image_path, mmap_mode='r')
     img = Image.open(image_path).convert('RGB')
     map_array = np.array(img)
     return map_array
 
+
+def pack_rgb(rgb):
+    """Kolory (..., 3) spakowane do jednej liczby 0xRRGGBB."""
+    rgb = np.asarray(rgb)
+    return (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2].astype(np.uint32)
+
+
+def build_color_table(colors=TERRAIN_COLORS, tolerance=0, default=EMPTY):
+    """Tablica 2**24 stanów indeksowana spakowanym RGB.
+
+    Kolor w odległości (euklidesowej w RGB) co najwyżej `tolerance` od któregoś z kolorów `colors`
+    dostaje stan najbliższego z nich - to pozwala wczytywać mapy z antyaliasingiem.
+    """
+    table = np.full(1 << 24, default, dtype=np.uint8)
+    radius = int(tolerance)
+    offsets = np.arange(-radius, radius + 1)
+    offsets = np.stack(np.meshgrid(offsets, offsets, offsets, indexing='ij'), axis=-1).reshape(-1, 3)
+    distances = (offsets ** 2).sum(axis=1)
+    offsets, distances = offsets[distances <= tolerance ** 2], distances[distances <= tolerance ** 2]
+
+    codes, dist, states = [], [], []
+    for color, state in colors.items():
+        rgb = np.asarray(color) + offsets
+        inside = np.all((rgb >= 0) & (rgb <= 255), axis=1)
+        codes.append(pack_rgb(rgb[inside]))
+        dist.append(distances[inside])
+        states.append(np.full(np.count_nonzero(inside), state, dtype=np.uint8))
+    codes, dist, states = np.concatenate(codes), np.concatenate(dist), np.concatenate(states)
+
+    # dla każdego kodu wygrywa najbliższy kolor (przy remisie - wcześniejszy w `colors`)
+    order = np.lexsort((dist, codes))
+    codes, states = codes[order], states[order]
+    nearest = np.concatenate(([True], codes[1:] != codes[:-1]))
+    table[codes[nearest]] = states[nearest]
+    return table
+
+
 # inicjalizacja przestrzeni automatu
-def initialize_map(map_array):
-    terrain = np.zeros(map_array.shape[:2], dtype=int)
-    for x in range(map_array.shape[0]):
-        for y in range(map_array.shape[1]):
-            r, g, b = map_array[x, y]
-            if (r, g, b) == (34, 139, 34):  # zielony
-                terrain[x, y] = TREE
-            elif (r, g, b) == (0, 0, 255):  # niebieski
-                terrain[x, y] = WATER
-            elif (r, g, b) == (139, 69, 19):  # brązowy na mapie -> szary w symulacji
-                terrain[x, y] = ROCK
+def initialize_map(map_array, colors=TERRAIN_COLORS, tolerance=0, tile_rows=1024, out=None):
+    """Stany terenu dla mapy (H, W, 3), dekodowane pasami po `tile_rows` wierszy.
+
+    Z mapą zmapowaną z dysku (load_map dla .npy) w pamięci jest naraz tylko jeden pas RGB; `out` może być
+    np. np.lib.format.open_memmap, wtedy także wynik zostaje na dysku.
+    """
+    table = build_color_table(colors, tolerance)
+    terrain = np.empty(map_array.shape[:2], dtype=np.uint8) if out is None else out
+    for start in range(0, map_array.shape[0], tile_rows):
+        band = np.asarray(map_array[start:start + tile_rows, :, :3])
+        terrain[start:start + tile_rows] = table[pack_rgb(band)]
     return terrain
 
 
-def update_fire_and_contamination(terrain, wind_direction=(0, 1), humidity=0.5, burn_time=None):
-    new_terrain = terrain.copy()
-    rows, cols = terrain.shape
-    if burn_time is None:
-        burn_time = np.zeros_like(terrain, dtype=int)
+def shift(mask, dx, dy):
+    """out[..., x, y] = mask[..., x + dx, y + dy]; False where (x + dx, y + dy) lies outside the map."""
+    rows, cols = mask.shape[-2:]
+    out = np.zeros_like(mask)
+    if abs(dx) < rows and abs(dy) < cols:
+        out[..., max(-dx, 0):rows - max(dx, 0), max(-dy, 0):cols - max(dy, 0)] = \
+            mask[..., max(dx, 0):rows + min(dx, 0), max(dy, 0):cols + min(dy, 0)]
+    return out
+
+
+def spread_probabilities(terrain, wind_direction=(0, 1), humidity=0.5):
+    """Prawdopodobieństwa, że drzewo/woda przetrwa krok, oraz maska płonącego lasu, który odlicza czas.
 
+    Działa także dla stosu map (..., rows, cols) - każda mapa jest liczona niezależnie.
+    """
     dx, dy = wind_direction
     weighted_neighbors = [
         (-1, 0, 0.2), (1, 0, 0.2), (0, -1, 0.2), (0, 1, 0.2),  # sąsiedzi w pobliżu
         (dx, dy, 0.5)  # kierunek wiatru
     ]
 
-    for x in range(1, rows - 1):
-        for y in range(1, cols - 1):
-            if terrain[x, y] == TREE:
-                # Reguła 1: wilgotność
-                for wx, wy, weight in weighted_neighbors:
-                    nx, ny = x + wx, y + wy
-                    if 0 <= nx < rows and 0 <= ny < cols and terrain[nx, ny] in [FIRE, BURNING_FOREST]:
-                        if np.random.rand() < weight * (1 - humidity):
-                            new_terrain[x, y] = BURNING_FOREST
-
-            elif terrain[x, y] == BURNING_FOREST:
-                # Reguła 2: czas trwania spalania
-                burn_time[x, y] += 1
-                if burn_time[x, y] >= 3:
-                    new_terrain[x, y] = BURNT
-
-                for wx, wy, weight in weighted_neighbors:
-                    nx, ny = x + wx, y + wy
-                    if 0 <= nx < rows and 0 <= ny < cols and terrain[nx, ny] == TREE:
-                        if np.random.rand() < weight:
-                            new_terrain[nx, ny] = BURNING_FOREST
-
-            # Reguła 3: skażenie wody
-            elif terrain[x, y] == CONTAMINATED_WATER:
-                for wx, wy, weight in weighted_neighbors:
-                    nx, ny = x + wx, y + wy
-                    if 0 <= nx < rows and 0 <= ny < cols and terrain[nx, ny] == WATER:
-                        if np.random.rand() < weight:
-                            new_terrain[nx, ny] = CONTAMINATED_WATER
-
-            # Reguła 4: teren niepalny
-            elif terrain[x, y] in [ROCK, WATER]:
-                new_terrain[x, y] = terrain[x, y]
+    # reguły działają tylko w komórkach wewnętrznych, ale mogą zmieniać sąsiadów na brzegu
+    interior = np.zeros(terrain.shape, dtype=bool)
+    interior[..., 1:-1, 1:-1] = True
+    tree = terrain == TREE
+    water = terrain == WATER
+    on_fire = (terrain == FIRE) | (terrain == BURNING_FOREST)
+    burning = interior & (terrain == BURNING_FOREST)
+    contaminated = interior & (terrain == CONTAMINATED_WATER)
+
+    # prawdopodobieństwo, że żadna próba nie zmieni komórki
+    tree_survives = np.ones(terrain.shape)
+    water_survives = np.ones(terrain.shape)
+    for wx, wy, weight in weighted_neighbors:
+        # Reguła 1: wilgotność - drzewo zapala się od płonącego sąsiada w (x + wx, y + wy)
+        tree_survives[interior & tree & shift(on_fire, wx, wy)] *= 1 - weight * (1 - humidity)
+        # płonący las w (x - wx, y - wy) podpala drzewo w (x, y)
+        tree_survives[tree & shift(burning, -wx, -wy)] *= 1 - weight
+        # Reguła 3: skażenie wody
+        water_survives[water & shift(contaminated, -wx, -wy)] *= 1 - weight
+
+    return tree_survives, water_survives, burning
+
+
+def draw_spread(new_terrain, tree_survives, water_survives, rng):
+    """Rozstrzyga wszystkich kandydatów jednym wywołaniem rng.random (drzewa, potem woda, w kolejności komórek)."""
+    tree_candidates = np.flatnonzero(tree_survives < 1)
+    water_candidates = np.flatnonzero(water_survives < 1)
+    draws = rng.random(tree_candidates.size + water_candidates.size)
+    tree_draws, water_draws = draws[:tree_candidates.size], draws[tree_candidates.size:]
+    new_terrain.flat[tree_candidates[tree_draws < 1 - tree_survives.flat[tree_candidates]]] = BURNING_FOREST
+    new_terrain.flat[water_candidates[water_draws < 1 - water_survives.flat[water_candidates]]] = CONTAMINATED_WATER
+
+
+def update_fire_and_contamination(terrain, wind_direction=(0, 1), humidity=0.5, burn_time=None, rng=None):
+    """Jeden krok automatu dla całej mapy naraz.
+
+    Każda próba zapalenia/skażenia z reguł 1-3 jest niezależna, więc dla każdej komórki liczone jest
+    prawdopodobieństwo, że żadna z jej prób się nie powiedzie, a losowanie odbywa się jednym wywołaniem
+    `rng.random` dla wszystkich komórek-kandydatów. Ten sam stan `rng` daje ten sam wynik.
+    """
+    new_terrain = terrain.copy()
+    if burn_time is None:
+        burn_time = np.zeros_like(terrain, dtype=int)
+    if rng is None:
+        rng = np.random.default_rng()
+
+    tree_survives, water_survives, burning = spread_probabilities(terrain, wind_direction, humidity)
+    draw_spread(new_terrain, tree_survives, water_survives, rng)
+
+    # Reguła 2: czas trwania spalania
+    burn_time[burning] += 1
+    new_terrain[burning & (burn_time >= 3)] = BURNT
+
+    # Reguła 4: teren niepalny (ROCK, WATER) pozostaje bez zmian - new_terrain jest kopią terrain
 
     return new_terrain, burn_time
 
 
+class FrontierFire:
+    """Silnik z jawnym zbiorem aktywnych komórek (FIRE, BURNING_FOREST, CONTAMINATED_WATER).
+
+    Krok przegląda tylko aktywne źródła i ich sąsiadów, więc koszt zależy od długości frontu, nie od
+    pola mapy. Teren jest zmieniany w miejscu. Kandydaci są losowani w tej samej kolejności co w
+    update_fire_and_contamination, więc przy tym samym stanie `rng` wynik jest taki sam.
+    """
+
+    def __init__(self, terrain, wind_direction=(0, 1), humidity=0.5, burn_time=None, rng=None):
+        self.terrain = np.ascontiguousarray(terrain)
+        self.burn_time = np.zeros_like(self.terrain, dtype=int) if burn_time is None else np.ascontiguousarray(burn_time)
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.humidity = humidity
+        self.wind_direction = tuple(wind_direction)
+        self.rebuild()
+
+    # pełny przegląd mapy - tylko na starcie i po zmianie wiatru (odrzucone źródła mogą znów sięgać drzew)
+    def rebuild(self):
+        self.active = np.flatnonzero(np.isin(self.terrain, (FIRE, BURNING_FOREST, CONTAMINATED_WATER)))
+
+    def set_wind(self, wind_direction):
+        if tuple(wind_direction) != self.wind_direction:
+            self.wind_direction = tuple(wind_direction)
+            self.rebuild()
+
+    def drop_bomb(self, x, y):
+        drop_bomb(self.terrain, x, y)
+        if self.terrain[x, y] in (BURNING_FOREST, CONTAMINATED_WATER):
+            self.active = np.union1d(self.active, [x * self.terrain.shape[1] + y])
+
+    def step(self):
+        terrain = self.terrain.reshape(-1)
+        burn_time = self.burn_time.reshape(-1)
+        rows, cols = self.terrain.shape
+        dx, dy = self.wind_direction
+        weighted_neighbors = [
+            (-1, 0, 0.2), (1, 0, 0.2), (0, -1, 0.2), (0, 1, 0.2),  # sąsiedzi w pobliżu
+            (dx, dy, 0.5)  # kierunek wiatru
+        ]
+
+        sources = self.active
+        state = terrain[sources]
+        sx, sy = np.divmod(sources, cols)
+        interior = (sx >= 1) & (sx < rows - 1) & (sy >= 1) & (sy < cols - 1)
+        on_fire = (state == FIRE) | (state == BURNING_FOREST)
+        burning = interior & (state == BURNING_FOREST)
+        contaminated = interior & (state == CONTAMINATED_WATER)
+
+        # pary (cel, czynnik prawdopodobieństwa przetrwania) w kolejności reguł z update_fire_and_contamination
+        tree_pairs, water_pairs = [], []
+        used = np.zeros(sources.size, dtype=bool)
+        for wx, wy, weight in weighted_neighbors:
+            for sign, mask, factor, pairs, target_state, target_interior in (
+                    (-1, on_fire, 1 - weight * (1 - self.humidity), tree_pairs, TREE, True),  # Reguła 1
+                    (1, burning, 1 - weight, tree_pairs, TREE, False),
+                    (1, contaminated, 1 - weight, water_pairs, WATER, False)):  # Reguła 3
+                tx, ty = sx + sign * wx, sy + sign * wy
+                if target_interior:
+                    valid = mask & (tx >= 1) & (tx < rows - 1) & (ty >= 1) & (ty < cols - 1)
+                else:
+                    valid = mask & (tx >= 0) & (tx < rows) & (ty >= 0) & (ty < cols)
+                targets = tx[valid] * cols + ty[valid]
+                hit = terrain[targets] == target_state
+                used[np.flatnonzero(valid)[hit]] = True
+                pairs.append((targets[hit], factor))
+
+        new_states = []
+        for pairs in (tree_pairs, water_pairs):
+            candidates = np.unique(np.concatenate([targets for targets, _ in pairs]))
+            survives = np.ones(candidates.size)
+            for targets, factor in pairs:
+                survives[np.searchsorted(candidates, targets)] *= factor
+            new_states.append((candidates[survives < 1], survives[survives < 1]))
+
+        (tree_candidates, tree_survives), (water_candidates, water_survives) = new_states
+        draws = self.rng.random(tree_candidates.size + water_candidates.size)
+        tree_draws, water_draws = draws[:tree_candidates.size], draws[tree_candidates.size:]
+        ignited = tree_candidates[tree_draws < 1 - tree_survives]
+        polluted = water_candidates[water_draws < 1 - water_survives]
+
+        # Reguła 2: czas trwania spalania
+        burners = sources[burning]
+        burn_time[burners] += 1
+        burnt = burners[burn_time[burners] >= 3]
+        terrain[burnt] = BURNT
+        terrain[ignited] = BURNING_FOREST
+        terrain[polluted] = CONTAMINATED_WATER
+
+        # źródło bez drzew/wody w zasięgu pozostaje bezczynne do zmiany wiatru; płonący las musi dalej odliczać czas
+        keep = (used | burning) & (terrain[sources] != BURNT)
+        self.active = np.union1d(sources[keep], np.concatenate((ignited, polluted)))
+        return self.terrain, self.burn_time
+
+
 def drop_bomb(terrain, x, y):
     if terrain[x, y] == TREE:
         terrain[x, y] = BURNING_FOREST
@@ -95,23 +275,26 @@ def change_wind():
         return None
 
 
-def plot_map(terrain, step, gif_writer):
-    colors = {
-        EMPTY: (255, 255, 255),  # biały
-        TREE: (34, 139, 34),     # zielony
-        FIRE: (255, 0, 0),       # czerwony
-        BURNING_FOREST: (255, 20, 147),  # różowy
-        BURNT: (0, 0, 0),        # czarny
-        WATER: (0, 0, 255),      # niebieskiB,
-        CONTAMINATED_WATER: (0, 255, 0),  # jaskrawozielony
-        ROCK: (128, 128, 128),   # szary
-    }
+# kolory stanów w animacji
+PALETTE = np.zeros((8, 3), dtype=np.uint8)
+PALETTE[EMPTY] = (255, 255, 255)            # biały
+PALETTE[TREE] = (34, 139, 34)               # zielony
+PALETTE[FIRE] = (255, 0, 0)                 # czerwony
+PALETTE[BURNING_FOREST] = (255, 20, 147)    # różowy
+PALETTE[BURNT] = (0, 0, 0)                  # czarny
+PALETTE[WATER] = (0, 0, 255)                # niebieski
+PALETTE[CONTAMINATED_WATER] = (0, 255, 0)   # jaskrawozielony
+PALETTE[ROCK] = (128, 128, 128)             # szary
+
+STATE_NAMES = ["empty", "tree", "fire", "burnt", "water", "rock", "contaminated_water", "burning_forest"]
+
+
+def terrain_to_image(terrain):
+    return PALETTE[terrain]
 
-    img = np.zeros((*terrain.shape, 3), dtype=np.uint8)
-    for state, color in colors.items():
-        img[terrain == state] = color
 
-    plt.imshow(img)
+def plot_map(terrain, step, gif_writer):
+    plt.imshow(terrain_to_image(terrain))
     plt.title(f"Step: {step}")
     plt.axis('off')
 
@@ -121,52 +304,275 @@ def plot_map(terrain, step, gif_writer):
     image = Image.open("/tmp/temp_image.png")
     gif_writer.append_data(np.array(image))
 
-def simulate_fire(map_path, steps=100, wind_direction=(0, 1), humidity=0.5, output_gif_path='/content/fire_simulation.gif'):
-    map_array = load_map(map_path)
-    terrain = initialize_map(map_array)
+
+# Scenariusze: pliki JSON opisujące cały przebieg, bez pytań w trakcie symulacji
+SCENARIO_DEFAULTS = {
+    "steps": 100,
+    "seed": None,
+    "engine": "dense",         # "dense" albo "frontier"
+    "wind": [[0, 0, 1]],       # [krok, dx, dy] - kierunek wiatru od danego kroku
+    "humidity": [[0, 0.5]],    # [krok, wilgotność] - wilgotność od danego kroku
+    "bombs": [],               # [krok, x, y] albo [krok] - pozycja losowana z generatora scenariusza
+    "ignition": None,          # [[x, y], ...] - komórki z ogniem na starcie; domyślnie środek mapy
+    "tolerance": 0,            # tolerancja kolorów mapy (build_color_table)
+    "gif": None,               # ścieżka animacji; bez niej klatki nie są tworzone
+}
+
+
+ENGINES = ("dense", "frontier")
+
+
+def validate_scenario(scenario, source="scenariusz"):
+    """ValueError dla nieznanego silnika i wpisów harmonogramów o złej długości."""
+    if scenario["engine"] not in ENGINES:
+        raise ValueError(f"{source}: nieznany silnik {scenario['engine']!r}, dostępne: {', '.join(ENGINES)}")
+    for key, lengths, form in (("wind", (3,), "[krok, dx, dy]"), ("humidity", (2,), "[krok, wilgotność]"),
+                               ("bombs", (1, 3), "[krok, x, y] albo [krok]"), ("ignition", (2,), "[x, y]")):
+        for entry in scenario[key] or ():
+            if not isinstance(entry, (list, tuple)) or len(entry) not in lengths:
+                raise ValueError(f"{source}: wpis {key} {entry!r} powinien mieć postać {form}")
+
+
+def load_scenario(path):
+    """Scenariusz z pliku JSON uzupełniony wartościami domyślnymi; ścieżki są względne do pliku."""
+    with open(path) as f:
+        data = json.load(f)
+    if "map" not in data:
+        raise ValueError(f"{path}: scenariusz musi zawierać 'map'")
+    unknown = set(data) - set(SCENARIO_DEFAULTS) - {"map", "name"}
+    if unknown:
+        raise ValueError(f"{path}: nieznane pola scenariusza: {sorted(unknown)}")
+
+    scenario = {**SCENARIO_DEFAULTS, **data}
+    scenario.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    base = os.path.dirname(os.path.abspath(path))
+    scenario["map"] = os.path.join(base, scenario["map"])
+    if scenario["gif"] is not None:
+        scenario["gif"] = os.path.join(base, scenario["gif"])
+    validate_scenario(scenario, path)
+    return scenario
+
+
+def run_scenario(scenario, metrics_path=None, wind_prompt=None, frame=None, log=None):
+    """Przebieg scenariusza bez okna i bez input().
+
+    Po każdym kroku do `metrics_path` (CSV) trafia wiersz z krokiem, wiatrem, wilgotnością i liczbą
+    komórek w każdym stanie. `wind_prompt(step)` może zwrócić nowy kierunek wiatru (front interaktywny),
+    `frame(terrain, step, gif_writer)` zastępuje domyślne klatki animacji.
+    """
+    scenario = {**SCENARIO_DEFAULTS, **scenario}
+    validate_scenario(scenario, scenario.get("name") or "scenariusz")
+    start = time.perf_counter()
+    rng = np.random.default_rng(scenario["seed"])
+    terrain = initialize_map(load_map(scenario["map"]), tolerance=scenario["tolerance"])
+    rows, cols = terrain.shape
+
+    # start fire w pktcie środkowym albo w podanych komórkach
+    for x, y in scenario["ignition"] or [(rows // 2, cols // 2)]:
+        terrain[x, y] = FIRE
+
+    bombs_schedule = {}
+    for bomb in scenario["bombs"]:
+        step, position = bomb[0], tuple(bomb[1:]) or (int(rng.integers(rows)), int(rng.integers(cols)))
+        bombs_schedule.setdefault(step, []).append(position)
+    if log is not None:
+        log(f"pozycje bomb: {[position for positions in bombs_schedule.values() for position in positions]}")
+    wind_schedule = {step: (dx, dy) for step, dx, dy in scenario["wind"]}
+    humidity_schedule = {step: value for step, value in scenario["humidity"]}
+
+    wind_direction, humidity = (0, 1), 0.5
     burn_time = np.zeros_like(terrain, dtype=int)
+    # engine="frontier": krok kosztuje tyle, ile długość frontu pożaru
+    fire = FrontierFire(terrain, wind_direction, humidity, burn_time, rng) if scenario["engine"] == "frontier" else None
 
-    # start fire w pktcie środkowym
-    mid_x, mid_y = terrain.shape[0] // 2, terrain.shape[1] // 2
-    terrain[mid_x, mid_y] = FIRE
+    gif_writer = imageio.get_writer(scenario["gif"], mode='I', duration=0.5) if scenario["gif"] else None
+    metrics_file = open(metrics_path, "w", newline="") if metrics_path else None
+    try:
+        metrics = csv.writer(metrics_file) if metrics_file else None
+        if metrics:
+            metrics.writerow(["step", "wind_dx", "wind_dy", "humidity"] + STATE_NAMES)
 
-    # BOMBY:
+        for step in range(scenario["steps"]):
+            # zrzut bomb
+            for x, y in bombs_schedule.get(step, ()):
+                if fire is not None:
+                    fire.drop_bomb(x, y)
+                else:
+                    drop_bomb(terrain, x, y)
+
+            # zmiana kierunku wiatru i wilgotności
+            wind_direction = wind_schedule.get(step, wind_direction)
+            humidity = humidity_schedule.get(step, humidity)
+            if wind_prompt is not None:
+                wind_direction = wind_prompt(step) or wind_direction
+
+            if frame is not None:
+                frame(terrain, step, gif_writer)
+            elif gif_writer is not None:
+                gif_writer.append_data(terrain_to_image(terrain))
+
+            if fire is not None:
+                fire.set_wind(wind_direction)
+                fire.humidity = humidity
+                terrain, burn_time = fire.step()
+            else:
+                terrain, burn_time = update_fire_and_contamination(terrain, wind_direction, humidity, burn_time, rng)
+
+            if metrics:
+                metrics.writerow([step + 1, *wind_direction, humidity, *np.bincount(terrain.ravel(), minlength=8)])
+    finally:
+        if gif_writer is not None:
+            gif_writer.close()
+        if metrics_file is not None:
+            metrics_file.close()
+
+    return {
+        "name": scenario.get("name"),
+        "steps": scenario["steps"],
+        "wall_time": time.perf_counter() - start,
+        "final_counts": dict(zip(STATE_NAMES, np.bincount(terrain.ravel(), minlength=8).tolist())),
+        "metrics_path": metrics_path,
+    }
+
+
+# metryki nazwane od pliku scenariusza (unikalnego w katalogu), nie od pola "name", które może się powtarzać
+def run_scenario_file(path, output_dir):
+    scenario = load_scenario(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return run_scenario(scenario, os.path.join(output_dir, f"{stem}.csv"))
+
+
+def run_scenarios(directory, output_dir=None, processes=None):
+    """Wszystkie scenariusze *.json z katalogu, rozłożone na procesy; metryki w output_dir/<nazwa pliku>.csv."""
+    output_dir = directory if output_dir is None else output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(glob.glob(os.path.join(directory, "*.json")))
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(run_scenario_file, paths, itertools.repeat(output_dir)))
+
+
+def print_report(results):
+    for r in results:
+        counts = r["final_counts"]
+        print(f"{r['name']:>20} {r['steps']:>5}  {r['wall_time']:8.3f} s  burnt {counts['burnt']:>8}  "
+              f"burning {counts['burning_forest']:>8}  contaminated {counts['contaminated_water']:>8}  -> {r['metrics_path']}")
+
+
+# Interaktywny front: pytania o bomby na starcie i o wiatr co 30 kroków
+def prompt_bombs():
     num_bombs = int(input("podaj liczbę bomb do zrzutu: "))
     bomb_iterations = list(map(int, input("podaj iteracje zrzutu bomb (oddzielone spacją): ").split()))
 
     if len(bomb_iterations) != num_bombs:
         print("EROOR: liczba iteracji nie równa liczbie bomb.")
-        return
+        return None
+    return [[step] for step in bomb_iterations]
 
-    rows, cols = terrain.shape
-    bomb_positions = [(random.randint(0, rows - 1), random.randint(0, cols - 1)) for _ in range(num_bombs)]
-    print(f"pzycje bomb (losowe): {bomb_positions}")
 
-    bombs_schedule = {}
-    for i in range(num_bombs):
-        if bomb_iterations[i] not in bombs_schedule:
-            bombs_schedule[bomb_iterations[i]] = []
-        bombs_schedule[bomb_iterations[i]].append(bomb_positions[i])
+def prompt_wind(step):
+    if step % 30 == 0:
+        user_action = input("czy chcesz zmienić kierunek wiatru (tak/nie)? ").strip().lower()
+        if user_action == 'tak':
+            return change_wind()
+    return None
+
+
+def show_frame(terrain, step, gif_writer):
+    clear_output(wait=True)
+    plot_map(terrain, step, gif_writer)
 
-    with imageio.get_writer(output_gif_path, mode='I', duration=0.5) as gif_writer:
-        for step in range(steps):
-            # zrzut bomb
-            if step in bombs_schedule:
-                for x, y in bombs_schedule[step]:
-                    drop_bomb(terrain, x, y)
 
-            # zmiana kierunku wiatru
-            if step % 30 == 0:
-                user_action = input("czy chcesz zmienić kierunek wiatru (tak/nie)? ").strip().lower()
-                if user_action == 'tak':
-                    new_wind = change_wind()
-                    if new_wind is not None:
-                        wind_direction = new_wind
+def simulate_fire(map_path, steps=100, wind_direction=(0, 1), humidity=0.5, output_gif_path='/content/fire_simulation.gif',
+                  seed=None, engine="dense", interactive=True):
+    scenario = {
+        "map": map_path,
+        "steps": steps,
+        "seed": seed,
+        "engine": engine,
+        "wind": [[0, *wind_direction]],
+        "humidity": [[0, humidity]],
+        "gif": output_gif_path,
+    }
+    if not interactive:
+        return run_scenario(scenario)
+
+    # BOMBY:
+    bombs = prompt_bombs()
+    if bombs is None:
+        return
+    scenario["bombs"] = bombs
+    return run_scenario(scenario, wind_prompt=prompt_wind, frame=show_frame, log=print)
+
+
+# Monte Carlo: wiele niezależnych realizacji tego samego scenariusza, bez zapisywania klatek
+def run_ensemble_batch(terrain, seeds, steps, wind_direction=(0, 1), humidity=0.5):
+    """Realizacje ułożone wzdłuż pierwszej osi, każda z własnym generatorem z `seeds`.
+
+    Realizacja zależy tylko od swojego ziarna, więc wynik nie zależy od podziału na paczki.
+    """
+    rngs = [np.random.default_rng(seed) for seed in seeds]
+    terrains = np.repeat(terrain[None], len(rngs), axis=0)
+    burn_time = np.zeros(terrains.shape, dtype=int)
+    ignition_step = np.where(terrains == BURNING_FOREST, 0, -1)
+
+    for step in range(1, steps + 1):
+        tree_survives, water_survives, burning = spread_probabilities(terrains, wind_direction, humidity)
+        # bez płonącego lasu i kandydatów nic się już nie zmieni
+        if not burning.any() and np.all(tree_survives == 1) and np.all(water_survives == 1):
+            break
+        new_terrains = terrains.copy()
+        for i, rng in enumerate(rngs):
+            draw_spread(new_terrains[i], tree_survives[i], water_survives[i], rng)
+        burn_time[burning] += 1
+        new_terrains[burning & (burn_time >= 3)] = BURNT
+        ignition_step[(new_terrains == BURNING_FOREST) & (ignition_step < 0)] = step
+        terrains = new_terrains
+
+    burned = ignition_step >= 0
+    time_to_burn = np.where(burned, ignition_step, 0)
+    return {
+        "burn_count": burned.sum(axis=0),
+        "time_sum": time_to_burn.sum(axis=0),
+        "time_sq_sum": (time_to_burn ** 2).sum(axis=0),
+        "burned_area": burned.sum(axis=(1, 2)),
+    }
+
+
+def run_ensemble(terrain, realizations=100, steps=100, wind_direction=(0, 1), humidity=0.5, seed=None,
+                 batch_size=16, processes=None):
+    """Statystyki pożaru z `realizations` realizacji startujących z `terrain` (z już podłożonym ogniem).
+
+    Paczki po `batch_size` realizacji liczone są w osobnych procesach. Zwraca częstość spalenia każdej
+    komórki, rozkład spalonej powierzchni (liczba komórek lasu, które zapłonęły, dla każdej realizacji)
+    oraz średni czas do zapłonu komórki i jego odchylenie (NaN dla komórek, które nigdy nie zapłonęły).
+    """
+    seeds = np.random.SeedSequence(seed).spawn(realizations)
+    batches = [seeds[i:i + batch_size] for i in range(0, realizations, batch_size)]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        results = list(pool.map(run_ensemble_batch, itertools.repeat(terrain), batches, itertools.repeat(steps),
+                                itertools.repeat(wind_direction), itertools.repeat(humidity)))
+
+    burn_count = sum(r["burn_count"] for r in results)
+    time_sum = sum(r["time_sum"] for r in results)
+    time_sq_sum = sum(r["time_sq_sum"] for r in results)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_time = np.where(burn_count > 0, time_sum / burn_count, np.nan)
+        std_time = np.sqrt(np.maximum(time_sq_sum / burn_count - mean_time ** 2, 0))
+    return {
+        "burn_frequency": burn_count / realizations,
+        "burned_area": np.concatenate([r["burned_area"] for r in results]),
+        "mean_time_to_burn": mean_time,
+        "std_time_to_burn": std_time,
+    }
 
-            clear_output(wait=True)
-            plot_map(terrain, step, gif_writer)
-            terrain, burn_time = update_fire_and_contamination(terrain, wind_direction, humidity, burn_time)
 
+if __name__ == "__main__":
+    # python forest_fire_simulation.py <katalog ze scenariuszami> [katalog na metryki]
+    if len(sys.argv) > 1:
+        print_report(run_scenarios(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
+        sys.exit()
 
-#simulate_fire('mapa.png', steps=90, wind_direction=(0, 0), humidity=0.6, output_gif_path='/content/fire_simulation.gif')
-simulate_fire('mapa2.png', steps=90, wind_direction=(0, 0), humidity=0.6, output_gif_path='/content/fire_simulation2.gif')
+    #simulate_fire('mapa.png', steps=90, wind_direction=(0, 0), humidity=0.6, output_gif_path='/content/fire_simulation.gif')
+    simulate_fire('mapa2.png', steps=90, wind_direction=(0, 0), humidity=0.6, output_gif_path='/content/fire_simulation2.gif')
@@ -1,6 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pygame
 import numpy as np
 
+from checkpoint import checkpoint_exists, load_checkpoint, save_checkpoint
+from pygame_rendering import blit, cells_to_pixels, intensity_to_pixels, run_headless
+
 # Parameters
 GRID_SIZE = (100, 100)  # Size of the grid
 CELL_SIZE = 10  # Size of a single cell
@@ -17,124 +22,301 @@ WALL_HOLE_END = GRID_SIZE[1] // 2 + 5  # End of the hole in the wall
 velocities = [(1, 0), (-1, 0), (0, -1), (0, 1), (1, 1), (-1, -1), (1, -1), (-1, 1)]  # directions
 opposite_direction = lambda i: (i + 4) % 8  # Opposite direction index
 
-clock = pygame.time.Clock()
+
+# Lattice velocities as arrays (structure-of-arrays form: one plane per direction)
+VX = np.array([vx for vx, _ in velocities], dtype=np.float32)
+VY = np.array([vy for _, vy in velocities], dtype=np.float32)
+OPPOSITE = np.array([opposite_direction(i) for i in range(8)])
+
+# Source and target slices for moving a whole plane by (dx, dy) without wrapping
+def shift_slices(shape, dx, dy):
+    rows, cols = shape
+    target = (slice(max(dx, 0), rows + min(dx, 0)), slice(max(dy, 0), cols + min(dy, 0)))
+    source = (slice(max(-dx, 0), rows + min(-dx, 0)), slice(max(-dy, 0), cols + min(-dy, 0)))
+    return source, target
+
+# Shift a 2D array by (dx, dy) without wrapping; uncovered cells are zero
+def shift(plane, dx, dy):
+    source, target = shift_slices(plane.shape, dx, dy)
+    result = np.zeros_like(plane)
+    result[target] = plane[source]
+    return result
 
 # Class for the Lattice Boltzmann model
 class LatticeBoltzmann:
-    def __init__(self):
-        self.f_in = np.zeros((GRID_SIZE[0], GRID_SIZE[1], 8))  # Input distribution
+    def __init__(self, grid_size=GRID_SIZE, workers=1, populate=True):
+        self.grid_size = grid_size
+        self.workers = workers  # > 1: update() splits the lattice into slabs on a thread pool
+        self.pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        edges = np.linspace(0, grid_size[0], workers + 1).astype(int)
+        self.slabs = [(x0, x1) for x0, x1 in zip(edges[:-1], edges[1:]) if x0 < x1]
+        # Wall geometry scaled with the grid as in the module constants
+        self.wall_position = grid_size[0] // 4
+        self.wall_hole_start = grid_size[1] // 2 - 5
+        self.wall_hole_end = grid_size[1] // 2 + 5
+        self.f_in = np.zeros((8, grid_size[0], grid_size[1]), dtype=np.float32)  # Input distribution
         self.f_out = np.zeros_like(self.f_in)  # Output distribution
-        self.rho = np.zeros((GRID_SIZE[0], GRID_SIZE[1]))  # Density (concentration)
-        self.initialize()
+        self.f_next = np.zeros_like(self.f_in)  # Streaming target, swapped with f_in every step
+        self.rho = np.zeros(grid_size, dtype=np.float32)  # Density (concentration)
+        # Preallocated scratch planes so that steady-state stepping does not allocate
+        self.ux, self.uy, self.base, self.rho8, self.uv, self.tmp, self.post = (
+            np.zeros(grid_size, dtype=np.float32) for _ in range(7))
+        self.build_masks()
+        if populate:  # False: empty model whose state is filled in by restore()
+            self.initialize()
         self.tau = 0.6  # Relaxation time
 
+    def build_masks(self):
+        """Precompute, per direction, where streamed and bounced-back populations land."""
+        rows, cols = self.grid_size
+        x = np.arange(rows)[:, None]
+        y = np.arange(cols)[None, :]
+        self.slices = [shift_slices(self.grid_size, vx, vy) for vx, vy in velocities]
+        self.receives = np.zeros((8, rows, cols), dtype=bool)  # target takes the streamed population
+        self.bounces = np.zeros((8, rows, cols), dtype=bool)  # cell takes the opposite population back
+        self.empty = np.zeros((8, rows, cols), dtype=bool)  # cell gets nothing in this direction
+        for i, (vx, vy) in enumerate(velocities):
+            nx, ny = x + vx, y + vy
+            blocked = (nx == self.wall_position) & ~((self.wall_hole_start <= ny) & (ny < self.wall_hole_end))
+            inside = (0 <= nx) & (nx < rows) & (0 <= ny) & (ny < cols)
+            received = shift(~blocked & inside, vx, vy)
+            # Where a cell both bounces and receives, the write made later in (x, y) order wins
+            stream_wins = vx < 0 or (vx == 0 and vy < 0)
+            self.bounces[i] = blocked & ~received if stream_wins else blocked
+            self.receives[i] = received & ~self.bounces[i]
+            self.empty[i] = ~self.receives[i] & ~self.bounces[i]
+        # Streaming masks restricted to each direction's target slice
+        self.receives_target = [np.ascontiguousarray(self.receives[i][self.slices[i][1]]) for i in range(8)]
+
     def initialize(self):
-        for x in range(GRID_SIZE[0]):
-            for y in range(GRID_SIZE[1]):
-                self.rho[x, y] = 1.0 if x < GRID_SIZE[0] // 4 else 0.0
-        for x in range(GRID_SIZE[0]):
-            for y in range(GRID_SIZE[1]):
-                velocity = np.array([0, 0])
-                eq = self.calculate_equilibrium(self.rho[x, y], velocity)
-                self.f_in[x, y] = eq
-
-    def calculate_equilibrium(self, rho, velocity):
-        """Calculate the equilibrium distribution for each direction."""
+        self.rho[:, :] = 0.0
+        self.rho[:self.grid_size[0] // 4, :] = 1.0
+        zero = np.zeros_like(self.rho)
+        self.f_in[:] = self.calculate_equilibrium(self.rho, zero, zero)
+
+    def calculate_equilibrium(self, rho, ux, uy):
+        """Calculate the equilibrium distribution for each direction (arrays over the lattice)."""
         c = 1  # Lattice speed (assuming it is 1 here)
-        eq = np.zeros(8)
 
         # Limit prędkości (usqr) do sensownej wartości
-        usqr = min(velocity[0] ** 2 + velocity[1] ** 2, 100.0)  # Ustawienie limitu wartości prędkości
+        usqr = np.minimum(ux ** 2 + uy ** 2, 100.0)  # Ustawienie limitu wartości prędkości
 
-        for i in range(8):
-            vx, vy = velocities[i]
-            uv = velocity[0] * vx + velocity[1] * vy
-            uv = max(min(uv, 1.0), -1.0)  # Ograniczenie dot. prędkości (uv) do zakresu od -1 do 1
+        uv = VX[:, None, None] * ux + VY[:, None, None] * uy
+        uv = np.clip(uv, -1.0, 1.0)  # Ograniczenie dot. prędkości (uv) do zakresu od -1 do 1
 
-            eq[i] = (rho / 8) * (1 + 3 * uv / c + 9 * uv ** 2 / (2 * c ** 2) - 3 * usqr / (2 * c ** 2))
+        return (rho / 8) * (1 + 3 * uv / c + 9 * uv ** 2 / (2 * c ** 2) - 3 * usqr / (2 * c ** 2))
 
-        return eq
+    def macroscopic(self, rows=slice(None)):
+        """Density and velocity of f_in into the scratch planes (all in place, limited to a slab of rows)."""
+        f_in = self.f_in[:, rows]
+        rho, ux, uy, base, tmp = self.rho[rows], self.ux[rows], self.uy[rows], self.base[rows], self.tmp[rows]
+        np.sum(f_in, axis=0, out=rho)  # Calculate density
 
-    def collision(self):
-        """Perform collision step to compute new distributions."""
-        for x in range(GRID_SIZE[0]):
-            for y in range(GRID_SIZE[1]):
-                rho = np.sum(self.f_in[x, y])  # Calculate density
+        # Unikaj dzielenia przez zbyt małe wartości rho
+        np.maximum(rho, 1e-6, out=rho)  # Ustaw minimalną wartość dla rho
+
+        ux.fill(0.0)
+        uy.fill(0.0)
+        for i, (vx, vy) in enumerate(velocities):
+            if vx:
+                (np.add if vx > 0 else np.subtract)(ux, f_in[i], out=ux)
+            if vy:
+                (np.add if vy > 0 else np.subtract)(uy, f_in[i], out=uy)
+
+        # Normalizacja prędkości przez rho (gęstość)
+        for u in (ux, uy):
+            np.divide(u, rho, out=u)
+            np.clip(u, -5.0, 5.0, out=u)  # Ograniczenie wartości prędkości do rozsądnego zakresu
 
-                # Unikaj dzielenia przez zbyt małe wartości rho
-                if rho < 1e-6:  # Zbyt mała gęstość może powodować problemy
-                    rho = 1e-6  # Ustaw minimalną wartość dla rho
+        # Terms shared by all directions: rho / 8 and 1 - 3/2 * usqr (usqr limited to 100)
+        np.multiply(ux, ux, out=base)
+        np.multiply(uy, uy, out=tmp)
+        base += tmp
+        np.minimum(base, 100.0, out=base)
+        base *= -1.5
+        base += 1.0
+        np.multiply(rho, 0.125, out=self.rho8[rows])
 
-                velocity = np.array([0.0, 0.0])
-                for i, (vx, vy) in enumerate(velocities):
-                    velocity += np.array([vx, vy]) * self.f_in[x, y, i]
+    def relax(self, i, out, rows=slice(None)):
+        """Post-collision population of direction i: f - (f - eq) / tau, written to out (a slab of rows)."""
+        uv, eq = self.uv[rows], self.tmp[rows]
+        vx, vy = velocities[i]
+        np.multiply(self.ux[rows], vx, out=uv)
+        np.multiply(self.uy[rows], vy, out=eq)
+        uv += eq
+        np.clip(uv, -1.0, 1.0, out=uv)
 
-                # Normalizacja prędkości przez rho (gęstość)
-                if rho > 0:
-                    velocity /= rho
-                velocity = np.clip(velocity, -5.0, 5.0)  # Ograniczenie wartości prędkości do rozsądnego zakresu
+        # eq = rho / 8 * (1 + 3 uv + 9/2 uv^2 - 3/2 usqr)
+        np.multiply(uv, uv, out=eq)
+        eq *= 4.5
+        uv *= 3.0
+        eq += uv
+        eq += self.base[rows]
+        eq *= self.rho8[rows]
 
-                eq = self.calculate_equilibrium(rho, velocity)
-                self.f_out[x, y] = self.f_in[x, y] - (self.f_in[x, y] - eq) / self.tau
-                self.rho[x, y] = rho  # Zaktualizuj gęstość dla wizualizacji
+        omega = 1.0 / self.tau
+        np.multiply(self.f_in[i][rows], 1.0 - omega, out=out)
+        eq *= omega
+        out += eq
+
+    def scatter(self, i, post):
+        """Stream direction i's post-collision plane into f_next, with bounce-back at walls."""
+        source, target = self.slices[i]
+        np.copyto(self.f_next[i][target], post[source], where=self.receives_target[i])
+        # Boundary conditions: reflection at walls (the bounced population is stored under OPPOSITE[i])
+        j = OPPOSITE[i]
+        np.copyto(self.f_next[j], post, where=self.bounces[j])
+        np.copyto(self.f_next[i], 0.0, where=self.empty[i])
+
+    def collision(self):
+        """Perform collision step to compute new distributions."""
+        self.macroscopic()
+        for i in range(8):
+            self.relax(i, self.f_out[i])
 
     def streaming(self):
         """Perform streaming step, including reflection at walls."""
-        new_f = np.zeros_like(self.f_in)
-        for x in range(GRID_SIZE[0]):
-            for y in range(GRID_SIZE[1]):
-                for i, (vx, vy) in enumerate(velocities):
-                    nx, ny = x + vx, y + vy
-                    # Boundary conditions: reflection at walls
-                    if nx == WALL_POSITION and not (WALL_HOLE_START <= ny < WALL_HOLE_END):
-                        new_f[x, y, i] = self.f_out[x, y, opposite_direction(i)]
-                    else:
-                        if 0 <= nx < GRID_SIZE[0] and 0 <= ny < GRID_SIZE[1]:
-                            new_f[nx, ny, i] = self.f_out[x, y, i]
-        self.f_in = new_f
+        for i in range(8):
+            self.scatter(i, self.f_out[i])
+        self.f_in, self.f_next = self.f_next, self.f_in
+
+    def collide_and_stream(self):
+        """Fused step: each direction is relaxed into one scratch plane and streamed straight away."""
+        self.macroscopic()
+        for i in range(8):
+            self.relax(i, self.post)
+            self.scatter(i, self.post)
+        self.f_in, self.f_next = self.f_next, self.f_in
+
+    def stream_rows(self, i, x0, x1):
+        """Fill rows [x0, x1) of f_next[i] from f_out, reading one halo row on each side of the slab."""
+        vx, _ = velocities[i]
+        source, target = self.slices[i]
+        t0, t1 = max(target[0].start, x0), min(target[0].stop, x1)
+        if t0 < t1:
+            np.copyto(self.f_next[i][t0:t1, target[1]], self.f_out[i][t0 - vx:t1 - vx, source[1]],
+                      where=self.receives[i][t0:t1, target[1]])
+        # Boundary conditions: reflection at walls
+        np.copyto(self.f_next[i][x0:x1], self.f_out[OPPOSITE[i]][x0:x1], where=self.bounces[i][x0:x1])
+        np.copyto(self.f_next[i][x0:x1], 0.0, where=self.empty[i][x0:x1])
+
+    def collide_slab(self, x0, x1):
+        rows = slice(x0, x1)
+        self.macroscopic(rows)
+        for i in range(8):
+            self.relax(i, self.f_out[i][rows], rows)
+
+    def stream_slab(self, x0, x1):
+        for i in range(8):
+            self.stream_rows(i, x0, x1)
+
+    def update_parallel(self):
+        """Same step as update(), split into horizontal slabs processed on the model's thread pool.
+
+        Collision is local to each slab; streaming reads one halo row from each neighbouring slab,
+        so all slabs finish colliding before any of them streams.
+        """
+        list(self.pool.map(lambda slab: self.collide_slab(*slab), self.slabs))
+        list(self.pool.map(lambda slab: self.stream_slab(*slab), self.slabs))
+        self.f_in, self.f_next = self.f_next, self.f_in
+
+    def close(self):
+        """Shut down the slab thread pool (workers > 1); also called when used as a context manager."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save(self, path, step=0):
+        """Checkpoint the distributions and parameters (tau, wall geometry) to the directory path."""
+        save_checkpoint(path, {"f_in": self.f_in, "rho": self.rho}, {
+            "grid_size": list(self.grid_size),
+            "tau": self.tau,
+            "wall_position": self.wall_position,
+            "wall_hole_start": self.wall_hole_start,
+            "wall_hole_end": self.wall_hole_end,
+            "step": step,
+        })
+
+    @classmethod
+    def restore(cls, path, workers=1):
+        """Model and step from a checkpoint; f_in stays memory-mapped until the first update replaces it."""
+        arrays, params = load_checkpoint(path)
+        model = cls(tuple(params["grid_size"]), workers, populate=False)
+        model.tau = params["tau"]
+        wall = (params["wall_position"], params["wall_hole_start"], params["wall_hole_end"])
+        if wall != (model.wall_position, model.wall_hole_start, model.wall_hole_end):
+            model.wall_position, model.wall_hole_start, model.wall_hole_end = wall
+            model.build_masks()
+        model.f_in = arrays["f_in"]
+        model.rho[:] = arrays["rho"]
+        return model, params["step"]
 
     def update(self):
-        self.collision()
-        self.streaming()
-
-# Initialize Pygame
-pygame.init()
-screen = pygame.display.set_mode((GRID_SIZE[0] * CELL_SIZE, GRID_SIZE[1] * CELL_SIZE))
-pygame.display.set_caption('Lattice Boltzmann Simulation - density')
-
-# Create an instance of the LatticeBoltzmann class
-lb_model = LatticeBoltzmann()
-
-# Function to draw the wall
-def draw_wall(screen):
-    for y in range(GRID_SIZE[1]):
-        if WALL_HOLE_START <= y < WALL_HOLE_END:
-            continue
-        x = WALL_POSITION
-        pygame.draw.rect(screen, WALL_COLOR, (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-
-# Main loop
-running = True
-while running:
-    screen.fill(BACKGROUND_COLOR)
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    draw_wall(screen)
-    lb_model.update()
-
-    # Visualize density using intensity of the color
-    max_rho = np.max(lb_model.rho)
-    if max_rho > 0:
-        for x in range(GRID_SIZE[0]):
-            for y in range(GRID_SIZE[1]):
-                intensity = int(255 * lb_model.rho[x, y] / max_rho)
-                intensity = max(0, min(255, intensity))  # Ensure intensity is within [0, 255]
-                pygame.draw.rect(screen, (intensity, intensity, intensity),
-                                 (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-
-    pygame.display.flip()
-    clock.tick(FPS)
-
-pygame.quit()
+        if self.workers > 1:
+            self.update_parallel()
+        else:
+            self.collide_and_stream()
+
+# Wall cells (the hole is [WALL_HOLE_START, WALL_HOLE_END) as in streaming)
+def wall_cells():
+    wall = np.zeros(GRID_SIZE, dtype=bool)
+    wall[WALL_POSITION, :] = True
+    wall[WALL_POSITION, WALL_HOLE_START:WALL_HOLE_END] = False
+    return wall
+
+# Density as grey intensity, wall drawn on top
+def render_pixels(model, wall):
+    pixels = intensity_to_pixels(model.rho, CELL_SIZE)
+    pixels[cells_to_pixels(wall, CELL_SIZE)] = WALL_COLOR
+    return pixels
+
+def step_model(model):
+    model.update()
+    return model
+
+# Run without a display; every frame_every-th step is rendered to a pixel buffer (0 -> no frames)
+# Checkpoint every checkpoint_every steps to checkpoint_path; an existing checkpoint there is resumed
+def run(steps=100, frame_every=0, checkpoint_path=None, checkpoint_every=0):
+    wall = wall_cells()
+    if checkpoint_path is not None and checkpoint_exists(checkpoint_path):
+        model, step = LatticeBoltzmann.restore(checkpoint_path)
+    else:
+        model, step = LatticeBoltzmann(), 0
+    return run_headless(step_model, model, steps, lambda m: render_pixels(m, wall), frame_every,
+                        lambda m, s: m.save(checkpoint_path, s), checkpoint_every if checkpoint_path else 0, step)
+
+def main():
+    pygame.init()
+    screen = pygame.display.set_mode((GRID_SIZE[0] * CELL_SIZE, GRID_SIZE[1] * CELL_SIZE))
+    pygame.display.set_caption('Lattice Boltzmann Simulation - density')
+    clock = pygame.time.Clock()
+
+    lb_model = LatticeBoltzmann()
+    wall = wall_cells()
+
+    # Main loop
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        lb_model.update()
+
+        # Visualize density using intensity of the color
+        blit(screen, render_pixels(lb_model, wall))
+
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import pygame
 import numpy as np
-import random
+
+from checkpoint import checkpoint_exists, load_checkpoint, save_checkpoint
+from pygame_rendering import blit, palette_to_pixels, run_headless
 
 # Parameters
 GRID_SIZE = (100, 100)  # Size of the grid
@@ -18,164 +20,279 @@ WALL_HOLE_END = GRID_SIZE[1] // 2 + 5  # End of the hole in the wall
 
 # Directions for D2Q8 (8 directions: right, left, up, down, and diagonals)
 velocities = [(1, 0), (-1, 0), (0, -1), (0, 1), (1, 1), (-1, -1), (1, -1), (-1, 1)]  # right, left, down, up, and diagonals
-clock = pygame.time.Clock()
+VX = np.array([vx for vx, _ in velocities], dtype=np.int16)
+VY = np.array([vy for _, vy in velocities], dtype=np.int16)
+
+# Slice pairs (target, source) that move a whole plane by (dx, dy) with periodic wrap
+def roll_slices(shape, dx, dy):
+    def axis_pairs(n, d):
+        if d == 0:
+            return [(slice(None), slice(None))]
+        if d > 0:
+            return [(slice(d, None), slice(None, n - d)), (slice(None, d), slice(n - d, None))]
+        return [(slice(None, n + d), slice(-d, None)), (slice(n + d, None), slice(None, -d))]
+    return [((tx, ty), (sx, sy)) for tx, sx in axis_pairs(shape[0], dx) for ty, sy in axis_pairs(shape[1], dy)]
 
 # Class for the Lattice Boltzmann model
 class LatticeBoltzmann:
-    def __init__(self):
+    def __init__(self, grid_size=GRID_SIZE, seed=None, populate=True):
+        self.grid_size = grid_size
+        self.rng = np.random.default_rng(seed)
+        # Wall geometry scaled with the grid as in the module constants
+        self.wall_position = grid_size[0] // 4
+        self.wall_hole_start = grid_size[1] // 2 - 5
+        self.wall_hole_end = grid_size[1] // 2 + 5
         # Initialize distribution functions
-        self.f = np.zeros((GRID_SIZE[0], GRID_SIZE[1], 8))  # 8 for D2Q8 (8 directions)
-        self.particles = []  # List of particle positions and their velocities
-        self.initialize()
+        self.f = np.zeros((8, grid_size[0], grid_size[1]), dtype=np.float32)  # 8 for D2Q8 (8 directions)
+        self.f_next = np.zeros_like(self.f)  # Streaming target, swapped with f every step
+        # Preallocated scratch planes so that steady-state stepping does not allocate
+        self.rho, self.ux, self.uy, self.base, self.rho8, self.uv, self.tmp, self.post = (
+            np.zeros(grid_size, dtype=np.float32) for _ in range(8))
+        self.nonzero = np.zeros(grid_size, dtype=bool)
+        self.build_streaming()
+        # Particles as parallel arrays: positions and velocity direction
+        self.particle_x = np.zeros(0, dtype=np.int16)
+        self.particle_y = np.zeros(0, dtype=np.int16)
+        self.particle_direction = np.zeros(0, dtype=np.uint8)
+        if populate:  # False: empty model whose state is filled in by restore()
+            self.initialize()
         self.tau = 0.6  # Relaxation time
 
+    def build_streaming(self):
+        # Periodic shifts per direction and the targets fed by cells in the hole (those do not stream)
+        self.slices = [roll_slices(self.grid_size, vx, vy) for vx, vy in velocities]
+        hole_y = np.arange(self.wall_hole_start, self.wall_hole_end)
+        self.dropped = [((self.wall_position + vx) % self.grid_size[0], (hole_y + vy) % self.grid_size[1])
+                        for vx, vy in velocities]
+
     def initialize(self):
         # Generate a set number of particles
-        for _ in range(NUM_PARTICLES):
-            x = random.randint(0, GRID_SIZE[0] // 4 - 1)  # Only in the left region for particles
-            y = random.randint(0, GRID_SIZE[1] - 1)  # Random vertical position
-            direction = random.choice(range(8))  # Random initial velocity direction
-            self.particles.append((x, y, direction))  # Store position and velocity direction
-
-            # Set initial conditions for particles
-            self.f[x, y, direction] = 1.0
-
-    def calculate_equilibrium(self, rho, velocity):
-        """Calculate the equilibrium distribution for each direction."""
-        c = 1  # Lattice speed (assuming it is 1 here)
-        eq = np.zeros(8)
-
-        for i in range(8):
-            # Directions
-            vx, vy = velocities[i]
-            # Dot product of velocity and lattice velocity
-            uv = velocity[0] * vx + velocity[1] * vy
-            usqr = velocity[0] ** 2 + velocity[1] ** 2  # magnitude of velocity squared
-
-            # Equilibrium distribution function
-            eq[i] = (rho / 8) * (1 + 3 * uv / c + 9 * uv ** 2 / (2 * c ** 2) - 3 * usqr / (2 * c ** 2))
-
-        return eq
+        self.particle_x = self.rng.integers(0, self.grid_size[0] // 4, NUM_PARTICLES).astype(np.int16)  # Only in the left region
+        self.particle_y = self.rng.integers(0, self.grid_size[1], NUM_PARTICLES).astype(np.int16)  # Random vertical position
+        self.particle_direction = self.rng.integers(0, 8, NUM_PARTICLES).astype(np.uint8)  # Random initial direction
+
+        # Set initial conditions for particles
+        self.f[self.particle_direction, self.particle_x, self.particle_y] = 1.0
+
+    @property
+    def particles(self):
+        # (x, y, direction) tuples, for inspection
+        return list(zip(self.particle_x.tolist(), self.particle_y.tolist(), self.particle_direction.tolist()))
+
+    def macroscopic(self):
+        # Total density and velocity of f into the scratch planes (all in place)
+        rho, ux, uy = self.rho, self.ux, self.uy
+        np.sum(self.f, axis=0, out=rho)
+
+        ux.fill(0.0)
+        uy.fill(0.0)
+        for i, (vx, vy) in enumerate(velocities):
+            if vx:
+                (np.add if vx > 0 else np.subtract)(ux, self.f[i], out=ux)
+            if vy:
+                (np.add if vy > 0 else np.subtract)(uy, self.f[i], out=uy)
+
+        np.not_equal(rho, 0, out=self.nonzero)
+        np.divide(ux, rho, out=ux, where=self.nonzero)
+        np.divide(uy, rho, out=uy, where=self.nonzero)
+
+        # Terms shared by all directions: rho / 8 and 1 - 3/2 * usqr
+        np.multiply(ux, ux, out=self.base)
+        np.multiply(uy, uy, out=self.tmp)
+        self.base += self.tmp
+        self.base *= -1.5
+        self.base += 1.0
+        np.multiply(rho, 0.125, out=self.rho8)
+
+    def relax(self, i, out):
+        # Post-collision population of direction i: f - (f - eq) / tau, written to out
+        uv, eq = self.uv, self.tmp
+        vx, vy = velocities[i]
+        # Dot product of velocity and lattice velocity
+        np.multiply(self.ux, vx, out=uv)
+        np.multiply(self.uy, vy, out=eq)
+        uv += eq
+
+        # Equilibrium distribution function: rho / 8 * (1 + 3 uv + 9/2 uv^2 - 3/2 usqr)
+        np.multiply(uv, uv, out=eq)
+        eq *= 4.5
+        uv *= 3.0
+        eq += uv
+        eq += self.base
+        eq *= self.rho8
+
+        omega = 1.0 / self.tau
+        np.multiply(self.f[i], 1.0 - omega, out=out)
+        eq *= omega
+        out += eq
+
+    def scatter(self, i, post):
+        # Stream direction i's post-collision plane into f_next (periodic boundary)
+        target_plane = self.f_next[i]
+        for target, source in self.slices[i]:
+            target_plane[target] = post[source]
+        target_plane[self.dropped[i]] = 0.0
 
     def collision(self):
         # Calculate equilibrium and update distribution functions
-        for x in range(GRID_SIZE[0]):
-            for y in range(GRID_SIZE[1]):
-                rho = np.sum(self.f[x, y])  # Total density
-                velocity = np.array([0.0, 0.0])
-
-                for i, (vx, vy) in enumerate(velocities):
-                    velocity += np.array([vx, vy]) * self.f[x, y, i]
-
-                if rho != 0:
-                    velocity /= rho
-
-                eq = self.calculate_equilibrium(rho, velocity)
-
-                for i in range(8):
-                    self.f[x, y, i] = self.f[x, y, i] - (self.f[x, y, i] - eq[i]) / self.tau
+        self.macroscopic()
+        for i in range(8):
+            self.relax(i, self.f[i])
 
     def streaming(self):
         # Stream the distribution functions to neighboring cells
-        new_f = np.zeros_like(self.f)
-        for x in range(GRID_SIZE[0]):
-            for y in range(GRID_SIZE[1]):
-                for i, (vx, vy) in enumerate(velocities):
-                    nx, ny = (x + vx) % GRID_SIZE[0], (y + vy) % GRID_SIZE[1]  # Periodic boundary
-                    if not (x == WALL_POSITION and WALL_HOLE_START <= y < WALL_HOLE_END):
-                        new_f[nx, ny, i] = self.f[x, y, i]
-        self.f = new_f
+        for i in range(8):
+            self.scatter(i, self.f[i])
+        self.f, self.f_next = self.f_next, self.f
+
+    def collide_and_stream(self):
+        # Fused step: each direction is relaxed into one scratch plane and streamed straight away
+        self.macroscopic()
+        for i in range(8):
+            self.relax(i, self.post)
+            self.scatter(i, self.post)
+        self.f, self.f_next = self.f_next, self.f
 
     def handle_particle_collisions(self):
         """Detect and handle collisions between particles."""
-        position_dict = {}
-        new_particles = []
-
-        for x, y, direction in self.particles:
-            # Use position as a key to detect collisions
-            if (x, y) not in position_dict:
-                position_dict[(x, y)] = []
-            position_dict[(x, y)].append(direction)
-
-        for (x, y), directions in position_dict.items():
-            if len(directions) > 1:
-                # Collision detected, redistribute velocities
-                total_density = len(directions)
-                new_directions = random.sample(range(8), total_density)
-
-                for new_direction in new_directions:
-                    new_particles.append((x, y, new_direction))
-            else:
-                # No collision, retain original direction
-                new_particles.append((x, y, directions[0]))
-
-        self.particles = new_particles
+        if len(self.particle_x) == 0:
+            return
+        # Co-located particles are adjacent after sorting by linearized cell index
+        cell = self.particle_x.astype(np.int64) * self.grid_size[1] + self.particle_y
+        order = np.argsort(cell, kind="stable")
+        _, starts, counts = np.unique(cell[order], return_index=True, return_counts=True)
+
+        collided = counts > 1
+        if not collided.any():
+            return
+        # Collision detected, redistribute velocities: every colliding cell draws a random permutation of
+        # the 8 directions (one batched draw) and its particles take distinct directions from it
+        permutations = self.rng.random((collided.sum(), 8)).argsort(axis=1).astype(np.uint8)
+        group = np.repeat(np.arange(len(counts)), counts)
+        rank = np.arange(len(order)) - starts[group]
+        colliding_group = np.cumsum(collided) - 1
+        in_collision = collided[group]
+        # More than 8 particles in one cell reuse directions (cycling through the permutation)
+        self.particle_direction[order[in_collision]] = permutations[colliding_group[group[in_collision]],
+                                                                    rank[in_collision] % 8]
 
     def update_particles(self):
         # Move particles according to their velocity and handle collisions with the wall and boundaries
-        new_particles = []
-        for x, y, direction in self.particles:
-            vx, vy = velocities[direction]
-            nx, ny = x + vx, y + vy
+        x, y = self.particle_x.astype(np.int32), self.particle_y.astype(np.int32)
+        direction = self.particle_direction.astype(np.int32)
+        vx, vy = VX[direction], VY[direction]
+        nx, ny = x + vx, y + vy
+
+        # Check boundary collisions
+        out_x = (nx < 0) | (nx >= self.grid_size[0])
+        direction = np.where(out_x, np.where(vx > 0, direction + 1, direction - 1) % 8, direction)
+        nx = np.clip(nx, 0, self.grid_size[0] - 1)
+        out_y = (ny < 0) | (ny >= self.grid_size[1])
+        direction = np.where(out_y, np.where(vy > 0, direction + 1, direction - 1) % 8, direction)
+        ny = np.clip(ny, 0, self.grid_size[1] - 1)
+
+        # Wall collision
+        wall = (nx == self.wall_position) & ~((self.wall_hole_start <= ny) & (ny < self.wall_hole_end))
+        direction = np.where(wall, (direction + 1) % 8, direction)
+        nx = np.where(wall, x, nx)
+        ny = np.where(wall, y, ny)
+
+        self.particle_x = nx.astype(np.int16)
+        self.particle_y = ny.astype(np.int16)
+        self.particle_direction = direction.astype(np.uint8)
+
+    def save(self, path, step=0):
+        # Checkpoint the distributions, particles, parameters (tau, wall geometry) and the generator state
+        save_checkpoint(path, {"f": self.f, "particle_x": self.particle_x, "particle_y": self.particle_y,
+                               "particle_direction": self.particle_direction}, {
+            "grid_size": list(self.grid_size),
+            "tau": self.tau,
+            "wall_position": self.wall_position,
+            "wall_hole_start": self.wall_hole_start,
+            "wall_hole_end": self.wall_hole_end,
+            "rng_state": self.rng.bit_generator.state,
+            "step": step,
+        })
+
+    @classmethod
+    def restore(cls, path, seed=None):
+        # Model and step from a checkpoint; f stays memory-mapped until the first update replaces it
+        # The saved generator state is resumed, so the run continues exactly; a seed starts a new stream instead
+        arrays, params = load_checkpoint(path)
+        model = cls(tuple(params["grid_size"]), seed=seed, populate=False)
+        if seed is None:
+            model.rng.bit_generator.state = params["rng_state"]
+        model.tau = params["tau"]
+        wall = (params["wall_position"], params["wall_hole_start"], params["wall_hole_end"])
+        if wall != (model.wall_position, model.wall_hole_start, model.wall_hole_end):
+            model.wall_position, model.wall_hole_start, model.wall_hole_end = wall
+            model.build_streaming()
+        model.f = arrays["f"]
+        model.particle_x = np.array(arrays["particle_x"])
+        model.particle_y = np.array(arrays["particle_y"])
+        model.particle_direction = np.array(arrays["particle_direction"])
+        return model, params["step"]
 
-            # Check boundary collisions
-            if nx < 0 or nx >= GRID_SIZE[0]:
-                direction = (direction + 1) % 8 if vx > 0 else (direction - 1) % 8
-                nx = max(0, min(GRID_SIZE[0] - 1, nx))
-            if ny < 0 or ny >= GRID_SIZE[1]:
-                direction = (direction + 1) % 8 if vy > 0 else (direction - 1) % 8
-                ny = max(0, min(GRID_SIZE[1] - 1, ny))
+    def update(self):
+        self.collide_and_stream()
+        self.update_particles()
+        self.handle_particle_collisions()
 
-            # Wall collision
-            if nx == WALL_POSITION and not (WALL_HOLE_START <= ny < WALL_HOLE_END):
-                direction = (direction + 1) % 8
-                nx, ny = x, y
 
-            new_particles.append((nx, ny, direction))
+# Wall cells as drawn (the hole is [WALL_HOLE_START, WALL_HOLE_END])
+def wall_cells():
+    wall = np.zeros(GRID_SIZE, dtype=bool)
+    wall[WALL_POSITION, :] = True
+    wall[WALL_POSITION, WALL_HOLE_START:WALL_HOLE_END + 1] = False
+    return wall
 
-        self.particles = new_particles
+# Occupied cells and the wall as one pixel buffer
+def render_pixels(model, wall):
+    indices = wall.astype(np.uint8) * 2
+    indices[model.particle_x, model.particle_y] = 1
+    return palette_to_pixels(indices, [BACKGROUND_COLOR, PARTICLE_COLOR, WALL_COLOR], CELL_SIZE)
 
-    def update(self):
-        self.collision()
-        self.streaming()
-        self.update_particles()
-        self.handle_particle_collisions()
+def step_model(model):
+    model.update()
+    return model
 
+# Run without a display; every frame_every-th step is rendered to a pixel buffer (0 -> no frames)
+# Checkpoint every checkpoint_every steps to checkpoint_path; an existing checkpoint there is resumed
+# seed only applies to a fresh model; a resumed run continues the checkpointed generator
+def run(steps=100, frame_every=0, checkpoint_path=None, checkpoint_every=0, seed=None):
+    wall = wall_cells()
+    if checkpoint_path is not None and checkpoint_exists(checkpoint_path):
+        model, step = LatticeBoltzmann.restore(checkpoint_path)
+    else:
+        model, step = LatticeBoltzmann(seed=seed), 0
+    return run_headless(step_model, model, steps, lambda m: render_pixels(m, wall), frame_every,
+                        lambda m, s: m.save(checkpoint_path, s), checkpoint_every if checkpoint_path else 0, step)
 
-# Initialize Pygame
-pygame.init()
-screen = pygame.display.set_mode((GRID_SIZE[0] * CELL_SIZE, GRID_SIZE[1] * CELL_SIZE))
-pygame.display.set_caption('Lattice Boltzmann Simulation with Particle Collisions')
+def main():
+    pygame.init()
+    screen = pygame.display.set_mode((GRID_SIZE[0] * CELL_SIZE, GRID_SIZE[1] * CELL_SIZE))
+    pygame.display.set_caption('Lattice Boltzmann Simulation with Particle Collisions')
+    clock = pygame.time.Clock()
 
-# Create an instance of the LatticeBoltzmann class
-lb_model = LatticeBoltzmann()
+    lb_model = LatticeBoltzmann()
+    wall = wall_cells()
 
-# Function to draw the wall
-def draw_wall(screen):
-    for y in range(GRID_SIZE[1]):
-        if WALL_HOLE_START <= y <= WALL_HOLE_END:
-            continue
-        x = WALL_POSITION
-        pygame.draw.rect(screen, WALL_COLOR, (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
+    # Main loop
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
 
-# Main loop
-running = True
-while running:
-    screen.fill(BACKGROUND_COLOR)
+        lb_model.update()
 
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+        blit(screen, render_pixels(lb_model, wall))
 
-    draw_wall(screen)
-    lb_model.update()
+        pygame.display.flip()
+        clock.tick(FPS)
 
-    for x, y, _ in lb_model.particles:
-        pygame.draw.circle(screen, PARTICLE_COLOR,
-                           (x * CELL_SIZE + CELL_SIZE // 2, y * CELL_SIZE + CELL_SIZE // 2),
-                           CELL_SIZE // 4)
+    pygame.quit()
 
-    pygame.display.flip()
-    clock.tick(FPS)
 
-pygame.quit()
+if __name__ == "__main__":
+    main()
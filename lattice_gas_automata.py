@@ -1,6 +1,9 @@
 import pygame
 import numpy as np
 
+from checkpoint import checkpoint_exists, load_checkpoint, save_checkpoint
+from pygame_rendering import blit, palette_to_pixels, run_headless
+
 
 GRID_SIZE = (100, 100)
 CELL_SIZE = 10
@@ -30,89 +33,116 @@ DIRECTIONS = {
 
 
 
-def initialize_grid(grid_size, num_particles):
+def default_wall_geometry(grid_size):
+    """(pozycja ściany, początek otworu, koniec otworu) przeskalowane do planszy jak stałe WALL_* dla GRID_SIZE."""
+    return grid_size[0] // 4, grid_size[1] // 2 - 5, grid_size[1] // 2 + 5
+
+
+# Stan komórki to bitmaska uint8: bit d ustawiony, gdy w komórce jest cząsteczka poruszająca się w kierunku d
+def initialize_grid(grid_size, num_particles, region=None, seed=None):
     """Tworzy siatkę z cząstkami, ustawionymi w losowych pozycjach po lewej stronie, zgodnie z liczbą cząsteczek."""
-    grid = np.zeros((grid_size[0], grid_size[1], 8), dtype=int)
+    if region is None:
+        region = np.zeros(grid_size, dtype=bool)
+        region[:default_wall_geometry(grid_size)[0], :] = True
+    return seed_particles(np.zeros(grid_size, dtype=np.uint8), num_particles, region, seed)
+
+
+def seed_particles(grid, num_particles, region, seed=None):
+    """Umieszcza cząsteczki w różnych losowych komórkach maski region (bez powtórzeń) z losowymi kierunkami."""
+    rng = np.random.default_rng(seed)
+    cells = np.flatnonzero(region & (grid == 0))
+    if num_particles > len(cells):
+        raise ValueError(f"region has only {len(cells)} free cells for {num_particles} particles")
+
+    chosen = rng.choice(cells, size=num_particles, replace=False)
+    directions = rng.integers(0, 8, size=num_particles, dtype=np.uint8)
+    grid.flat[chosen] = np.left_shift(np.uint8(1), directions)
+    return grid
 
-    count = 0
-    while count < num_particles:
-        x = np.random.randint(0, WALL_POSITION)
-        y = np.random.randint(0, grid_size[1])
-        direction = np.random.randint(0, 8)
 
-        if np.sum(grid[x, y]) == 0:
-            grid[x, y, direction] = 1
-            count += 1
 
-    return grid
+def render_pixels(grid, wall):
+    """Zamienia stan siatki na bufor pikseli: tło, komórki z cząsteczkami i ściany."""
+    indices = np.where(wall, 2, grid != 0)
+    return palette_to_pixels(indices, [BACKGROUND_COLOR, PARTICLE_COLOR, WALL_COLOR], CELL_SIZE)
+
+
 
+def reflected_direction(direction):
+    """Kierunek po odbiciu od ściany (jak w pierwotnej pętli: L<->R, U<->D, LU->LD, RU->RD, LD->L, RD->U)."""
+    if direction < 4:
+        return (direction + 2) % 4
+    return (direction + 2) % 8
 
 
-    """Rysuje siatkę na ekranie."""
-def draw_grid(screen, grid):
-    for x in range(grid.shape[0]):
-        for y in range(grid.shape[1]):
-            cx, cy = x * CELL_SIZE, y * CELL_SIZE
-            for direction in range(8):
-                if grid[x, y, direction] == 1:
-                    pygame.draw.circle(screen, PARTICLE_COLOR, (cx + CELL_SIZE // 2, cy + CELL_SIZE // 2), 2)
+def build_tables():
+    """Tablice 256 wartości: odbicie zablokowanych cząsteczek i zderzenie cząsteczek w jednej komórce."""
+    reflect = np.zeros(256, dtype=np.uint8)
+    collide = np.zeros(256, dtype=np.uint8)
+    for state in range(256):
+        for direction in range(8):
+            if state >> direction & 1:
+                reflect[state] |= 1 << reflected_direction(direction)
+        # zderzenie: każda cząsteczka w komórce zmienia kierunek na (d + 4) % 8
+        collide[state] = state if bin(state).count("1") < 2 else ((state << 4) | (state >> 4)) & 0xFF
+    return reflect, collide
 
 
+REFLECT_TABLE, COLLIDE_TABLE = build_tables()
 
-    """Rysuje pionową ścianę z otworem."""
-def draw_wall(screen):
-    for y in range(GRID_SIZE[1]):
-        if WALL_HOLE_START <= y <= WALL_HOLE_END:
-            continue
-        x = WALL_POSITION
-        pygame.draw.rect(screen, WALL_COLOR, (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
 
+def wall_mask(grid_size, wall_position=None, wall_hole_start=None, wall_hole_end=None):
+    """Maska ścian (brzegi planszy i pionowa ściana z otworem), to samo co is_wall dla całej siatki.
+
+    Pominięte parametry geometrii są skalowane z grid_size (default_wall_geometry).
+    """
+    defaults = default_wall_geometry(grid_size)
+    wall_position = defaults[0] if wall_position is None else wall_position
+    wall_hole_start = defaults[1] if wall_hole_start is None else wall_hole_start
+    wall_hole_end = defaults[2] if wall_hole_end is None else wall_hole_end
+    wall = np.zeros(grid_size, dtype=bool)
+    wall[0, :] = wall[-1, :] = wall[:, 0] = wall[:, -1] = True
+    wall[wall_position, :] = True
+    wall[wall_position, wall_hole_start:wall_hole_end + 1] = False
+    return wall
+
+
+def shift(plane, dx, dy):
+    """Przesuwa tablicę o (dx, dy) bez zawijania; odsłonięte komórki są zerowane."""
+    rows, cols = plane.shape
+    result = np.zeros_like(plane)
+    result[max(dx, 0):rows + min(dx, 0), max(dy, 0):cols + min(dy, 0)] = \
+        plane[max(-dx, 0):rows + min(-dx, 0), max(-dy, 0):cols + min(-dy, 0)]
+    return result
+
+
+def blocked_mask(wall):
+    """Bit d ustawiony, gdy ruch w kierunku d z danej komórki trafia w ścianę lub poza planszę."""
+    blocked = np.zeros(wall.shape, dtype=np.uint8)
+    for direction, (dx, dy) in DIRECTIONS.items():
+        # cel poza planszą traktowany jak ściana (padding True)
+        target_wall = ~shift(~wall, -dx, -dy)
+        blocked |= target_wall.astype(np.uint8) << direction
+    return blocked
 
 
     """Aktualizuje stan siatki (ruch cząsteczek)."""
-def update_grid(grid):
-    new_grid = np.zeros_like(grid)
-
-    # Streaming
-    for x in range(grid.shape[0]):
-        for y in range(grid.shape[1]):
-            for direction in range(8):
-                if grid[x, y, direction] == 1:
-                    dx, dy = DIRECTIONS[direction]
-                    new_x, new_y = x + dx, y + dy
-
-                    if 0 <= new_x < grid.shape[0] and 0 <= new_y < grid.shape[1]:
-                        if not is_wall(new_x, new_y):
-                            if np.sum(new_grid[new_x, new_y]) == 0:
-                                new_grid[new_x, new_y, direction] = 1
-                            else:
-                                # Zderzenie z inną cząsteczką
-                                new_direction = (direction + 4) % 8
-                                new_grid[x, y, new_direction] = 1
-                                for other_direction in range(8):
-                                    if new_grid[new_x, new_y, other_direction] == 1:
-                                        new_grid[new_x, new_y, (other_direction + 4) % 8] = 1
-                                        new_grid[new_x, new_y, other_direction] = 0
-                        else:
-                            if direction in [0, 2]:  # L, R
-                                new_grid[x, y, (direction + 2) % 4] = 1
-                            elif direction in [1, 3]:  # U, D
-                                new_grid[x, y, (direction + 2) % 4] = 1
-                            elif direction in [4, 5]:   # LU, RU
-                                new_grid[x, y, (direction + 2) % 8] = 1
-                            elif direction in [6, 7]:  # LD, RD
-                                new_grid[x, y, (direction + 2) % 8] = 1
-                    else:
-                        if direction in [0, 2]:  # L, R
-                            new_grid[x, y, (direction + 2) % 4] = 1
-                        elif direction in [1, 3]:  # U, D
-                            new_grid[x, y, (direction + 2) % 4] = 1
-                        elif direction in [4, 5]:  # LU, RU
-                            new_grid[x, y, (direction + 2) % 8] = 1
-                        elif direction in [6, 7]:  # LD, RD
-                            new_grid[x, y, (direction + 2) % 8] = 1
-
-    return new_grid
+def update_grid(grid, blocked=None):
+    if blocked is None:
+        blocked = blocked_mask(wall_mask(grid.shape))
+
+    # Odbicie od ściany w komórce źródłowej
+    staying = grid & blocked
+    new_grid = REFLECT_TABLE[staying]
+
+    # Streaming: 8 przesunięć całej siatki
+    moving = grid & ~blocked
+    for direction, (dx, dy) in DIRECTIONS.items():
+        plane = moving & np.uint8(1 << direction)
+        new_grid |= shift(plane, dx, dy)
+
+    # Zderzenie z inną cząsteczką
+    return COLLIDE_TABLE[new_grid]
 
 
 
@@ -128,6 +158,45 @@ def is_wall(x, y):
 
 
 
+def save_state(path, grid, step=0, wall_geometry=None):
+    """Zapisuje punkt kontrolny: siatkę cząsteczek i geometrię ściany (pozycja, początek i koniec otworu)."""
+    if wall_geometry is None:
+        wall_geometry = default_wall_geometry(grid.shape)
+    wall_position, wall_hole_start, wall_hole_end = wall_geometry
+    save_checkpoint(path, {"grid": grid}, {
+        "grid_size": list(grid.shape),
+        "wall_position": wall_position,
+        "wall_hole_start": wall_hole_start,
+        "wall_hole_end": wall_hole_end,
+        "step": step,
+    })
+
+
+def restore_state(path):
+    """Wczytuje punkt kontrolny (siatka mapowana w pamięci) i zwraca (grid, step, wall_geometry)."""
+    arrays, params = load_checkpoint(path)
+    wall_geometry = (params["wall_position"], params["wall_hole_start"], params["wall_hole_end"])
+    return arrays["grid"], params["step"], wall_geometry
+
+
+def run(num_particles=2000, steps=1000, frame_every=0, checkpoint_path=None, checkpoint_every=0):
+    """Symulacja bez okna: steps kroków, co frame_every-ty krok zapisywany bufor pikseli (0 -> bez klatek).
+
+    Co checkpoint_every kroków stan trafia do checkpoint_path; istniejący punkt kontrolny jest wznawiany.
+    """
+    if checkpoint_path is not None and checkpoint_exists(checkpoint_path):
+        grid, step, wall_geometry = restore_state(checkpoint_path)
+    else:
+        grid, step, wall_geometry = initialize_grid(GRID_SIZE, num_particles), 0, default_wall_geometry(GRID_SIZE)
+    # ściany z geometrii punktu kontrolnego, nie ze stałych modułu
+    wall = wall_mask(grid.shape, *wall_geometry)
+    blocked = blocked_mask(wall)
+    return run_headless(lambda g: update_grid(g, blocked), grid, steps,
+                        lambda g: render_pixels(g, wall), frame_every,
+                        lambda g, s: save_state(checkpoint_path, g, s, wall_geometry),
+                        checkpoint_every if checkpoint_path else 0, step)
+
+
 def main():
     pygame.init()
     screen = pygame.display.set_mode((GRID_SIZE[0] * CELL_SIZE, GRID_SIZE[1] * CELL_SIZE))
@@ -137,6 +206,8 @@ def main():
     num_particles = 2000
 
     grid = initialize_grid(GRID_SIZE, num_particles)
+    wall = wall_mask(GRID_SIZE)
+    blocked = blocked_mask(wall)
 
     running = True
     while running:
@@ -144,13 +215,9 @@ def main():
             if event.type == pygame.QUIT:
                 running = False
 
-        screen.fill(BACKGROUND_COLOR)
+        blit(screen, render_pixels(grid, wall))
 
-        draw_wall(screen)
-
-        draw_grid(screen, grid)
-
-        grid = update_grid(grid)
+        grid = update_grid(grid, blocked)
 
         pygame.display.flip()
         clock.tick(FPS)
@@ -160,4 +227,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,45 @@
+import numpy as np
+import pygame
+
+
+# Shared rendering for the pygame models: the whole state becomes one pixel buffer
+# (indexed [x, y] like pygame.surfarray) and is blitted in a single call.
+
+def cells_to_pixels(colors, cell_size):
+    """Scale an (X, Y, 3) array of cell colours to an (X * cell_size, Y * cell_size, 3) pixel buffer."""
+    return np.repeat(np.repeat(colors, cell_size, axis=0), cell_size, axis=1)
+
+
+def palette_to_pixels(indices, palette, cell_size):
+    """Map an (X, Y) array of palette indices to a pixel buffer."""
+    return cells_to_pixels(np.asarray(palette, dtype=np.uint8)[indices], cell_size)
+
+
+def intensity_to_pixels(values, cell_size):
+    """Grey levels scaled so that the maximum value is white."""
+    max_value = np.max(values)
+    if max_value > 0:
+        intensity = np.clip(255 * values / max_value, 0, 255).astype(np.uint8)
+    else:
+        intensity = np.zeros(values.shape, dtype=np.uint8)
+    return cells_to_pixels(np.repeat(intensity[..., None], 3, axis=2), cell_size)
+
+
+def blit(screen, pixels):
+    pygame.surfarray.blit_array(screen, pixels)
+
+
+def run_headless(update, state, steps, render=None, frame_every=0, checkpoint=None, checkpoint_every=0, start_step=0):
+    """Advance `state = update(state)` for `steps` steps without a display.
+
+    If `render` is given, every `frame_every`-th state is rendered and returned with the final state.
+    If `checkpoint` is given, it is called as checkpoint(state, step) every `checkpoint_every` steps.
+    """
+    frames = []
+    for step in range(start_step + 1, start_step + steps + 1):
+        state = update(state)
+        if render is not None and frame_every and step % frame_every == 0:
+            frames.append(render(state))
+        if checkpoint is not None and checkpoint_every and step % checkpoint_every == 0:
+            checkpoint(state, step)
+    return state, frames